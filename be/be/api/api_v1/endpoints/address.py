@@ -1,17 +1,51 @@
 from fastapi import APIRouter
-from be.api.deps import SessionDep
+from fastapi import Query
+from functools import partial
+from math import isinf
+from neo4j import AsyncSession
+from typing import Annotated
+from typing import Literal
+from starlette.concurrency import run_in_threadpool
+import numpy as np
+from be.config import settings
+from be.api.deps import AsyncSessionDep
+from be.api.responses import json_response
+from be.cache import LRUCache
+from be.exc.api import APIError
+from be.geo import convex_hull
+from be.geo import encode_polyline
+from be.geo import simplify
+from be.neo import neo_query_async
+from be.routing.ch import ch_shortest_path
+from be.routing.ch import get_contraction_hierarchy
+from be.routing.ch import reset_contraction_hierarchy
+from be.routing.graph import get_road_graph
+from be.routing.graph import sync_road_graph
+from be.routing.matrix import distance_matrix
+from be.routing.matrix import shutdown_matrix_executor
+from be.routing.search import astar
+from be.routing.search import dijkstra_bounded
+from be.routing.weights import Weight
+from be.snapshot import get_snapshot
 from be.schemas.http import ResponseBody
+from be.schemas.routing import Isochrone
+from be.schemas.routing import IsochronePoint
 from be.schemas.routing import PointNode
 from be.schemas.routing import Route
+from be.schemas.routing import RouteMatrix
+from be.schemas.routing import RouteMatrixQuery
+from be.schemas.routing import RoutePolyline
 from be.schemas.routing import AddressOption
+from be.schemas.routing import CacheInfo
+from be.versions import get_dataset_version
 
 
 router = APIRouter()
 
 
 @router.get('')
-def get_addresses(
-    session: SessionDep, search: str, limit: int = 25
+async def get_addresses(
+    session: AsyncSessionDep, search: str, limit: int = 25
 ) -> ResponseBody[list[AddressOption]]:
     query = '''
         CALL 
@@ -31,28 +65,350 @@ def get_addresses(
         LIMIT $limit
     '''
     params = {'search': search, 'limit': limit}
-    result = session.run(query=query, parameters=params).data()
-    return ResponseBody(data=[AddressOption.from_python(x) for x in result])
+    data = await neo_query_async(session, 'address_search', query, params)
+    return ResponseBody(data=[AddressOption.from_python(x) for x in data])
 
 
 @router.get('/route')
-def get_route(
-    session: SessionDep, source: int, dest: int
+async def get_route(
+    session: AsyncSessionDep,
+    source: int,
+    dest: int,
+    weight: Weight = 'length',
+    format: Literal['json', 'polyline'] = 'json',
+    tolerance: Annotated[float, Query(ge=0)] = 0.0,
 ) -> ResponseBody[Route]:
+    """
+    `weight=travel_time` finds the fastest instead of the shortest route,
+    `tolerance` (meters) drops points closer than that to the simplified
+    route (Douglas-Peucker), `format=polyline` returns the points as
+    a Google encoded polyline instead of an array of objects, its
+    `{"polyline": str, "precision": int}` data is outside the response
+    schema, which stays `ResponseBody[Route]` for the default format
+    """
+    route = await find_address_route(
+        session=session, source=source, dest=dest, weight=weight
+    )
+    points = np.array(route, dtype=np.float64).reshape(-1, 2)
+    if tolerance:
+        points = points[simplify(points[:, 0], points[:, 1], tolerance)]
+    if format == 'polyline':
+        return json_response(RoutePolyline(
+            polyline=encode_polyline(points[:, 0], points[:, 1]),
+            precision=5,
+        ))
+    resp = Route(
+        route=[PointNode(lat=x[0], lon=x[1]) for x in points.tolist()]
+    )
+    return ResponseBody(data=resp)
+
+
+@router.post('/route/matrix')
+async def get_route_matrix(
+    session: AsyncSessionDep, body: RouteMatrixQuery
+) -> ResponseBody[RouteMatrix]:
+    size = settings.ROUTE_MATRIX_MAX_SIZE
+    if len(body.sources) > size or len(body.destinations) > size:
+        raise APIError(
+            message=f'at most {size} sources and {size} destinations',
+            status_code=422,
+        )
+    await _get_road_version(session=session)
+    intersections = await _get_nearest_intersections(
+        session=session, ids=body.sources + body.destinations
+    )
+    # addresses without an intersection get a row / column of nulls
+    sources = [intersections.get(x, -1) for x in body.sources]
+    targets = [intersections.get(x, -1) for x in body.destinations]
+    matrix = await run_in_threadpool(
+        distance_matrix, sources, targets, body.weight
+    )
+    return ResponseBody(data=RouteMatrix(
+        sources=body.sources,
+        destinations=body.destinations,
+        weight=body.weight,
+        distances=[[None if isinf(d) else d for d in row] for row in matrix],
+    ))
+
+
+@router.get('/isochrone')
+async def get_isochrone(
+    session: AsyncSessionDep,
+    source: int,
+    distance: Annotated[
+        float, Query(gt=0, le=settings.ISOCHRONE_MAX_DISTANCE)
+    ],
+    weight: Weight = 'length',
+    shape: Literal['hull', 'points'] = 'hull',
+) -> ResponseBody[Isochrone]:
+    """
+    everything reachable within `distance` meters (seconds with
+    `weight=travel_time`) of the source address, as the convex hull of the
+    reached intersections or the intersections themselves with their cost,
+    always searched over the in-process road graph, `ROUTING_ENGINE` is not
+    consulted so the neo engine has no isochrone of its own
+    """
+    intersections = await _get_nearest_intersections(
+        session=session, ids=[source]
+    )
+    if source not in intersections:
+        return ResponseBody(
+            data=Isochrone(
+                distance=distance, weight=weight, points=[], hull=[]
+            )
+        )
+    lat, lon, lengths = await _get_cached_isochrone(
+        session=session,
+        source=intersections[source],
+        distance=distance,
+        weight=weight,
+    )
+    if shape == 'points':
+        return ResponseBody(data=Isochrone(
+            distance=distance,
+            weight=weight,
+            points=[
+                IsochronePoint(lat=x, lon=y, distance=d) for x, y, d in zip(
+                    lat.tolist(), lon.tolist(), lengths.tolist()
+                )
+            ],
+            hull=[],
+        ))
+    ring = convex_hull(lat, lon)
+    ring = np.append(ring, ring[:1])
+    return ResponseBody(data=Isochrone(
+        distance=distance,
+        weight=weight,
+        points=[],
+        hull=[
+            PointNode(lat=x, lon=y)
+            for x, y in zip(lat[ring].tolist(), lon[ring].tolist())
+        ],
+    ))
+
+
+@router.get('/route/cache')
+async def get_route_cache_info() -> ResponseBody[CacheInfo]:
+    stats = _route_cache.stats
+    return ResponseBody(data=CacheInfo(
+        hits=stats.hits,
+        misses=stats.misses,
+        evictions=stats.evictions,
+        items=stats.items,
+    ))
+
+
+_route_cache: LRUCache[tuple[int, int, Weight], list[tuple[float, float]]] = \
+    LRUCache(
+        max_items=settings.ROUTE_CACHE_MAX_ITEMS,
+        ttl=settings.ROUTE_CACHE_TTL
+    )
+
+
+# lat, lon of the reached intersections and their distances, coordinates
+# rather than node indices, which change when the graph is reloaded
+_Reached = tuple[np.ndarray, np.ndarray, np.ndarray]
+
+_isochrone_cache: LRUCache[tuple[int, float, Weight], _Reached] = LRUCache(
+    max_bytes=settings.ISOCHRONE_CACHE_MAX_BYTES,
+    ttl=settings.ISOCHRONE_CACHE_TTL,
+    sizeof=lambda x: sum(arr.nbytes for arr in x),
+)
+
+
+async def _get_road_version(session: AsyncSession) -> int:
+    """
+    version of the road data, in-process graphs built from an older one
+    are dropped and the matrix workers, which hold their own, are replaced
+    """
+    # a rebuilt snapshot carries the road version it was exported with
+    if settings.USE_SNAPSHOT:
+        version = get_snapshot().datasets.get('road', 0)
+    else:
+        version = await get_dataset_version(session=session, name='road')
+    if sync_road_graph(version):
+        reset_contraction_hierarchy()
+        shutdown_matrix_executor(wait=False)
+    return version
+
+
+async def _get_cached_isochrone(
+    session: AsyncSession, source: int, distance: float, weight: Weight
+) -> _Reached:
+    """
+    isochrone of an intersection osmid, addresses snapped to the same
+    intersection share the cached result
+    """
+    version = await _get_road_version(session=session)
+    if not settings.ISOCHRONE_CACHE_MAX_BYTES:
+        return await run_in_threadpool(
+            _get_isochrone_in_memory, source, distance, weight
+        )
+    _isochrone_cache.set_version(version)
+    key = (source, distance, weight)
+    result = _isochrone_cache.get(key)
+    if result is None:
+        result = await run_in_threadpool(
+            _get_isochrone_in_memory, source, distance, weight
+        )
+        _isochrone_cache.put(key, result, version=version)
+    return result
+
+
+def _get_isochrone_in_memory(
+    source: int, distance: float, weight: Weight
+) -> _Reached:
+    graph = get_road_graph(weight)
+    u = graph.node_index(source)
+    if u is None:
+        return np.empty(0), np.empty(0), np.empty(0)
+    nodes, lengths = dijkstra_bounded(graph, u, distance)
+    reached = np.array(nodes, dtype=np.int64)
+    return graph.lat[reached], graph.lon[reached], np.array(lengths)
+
+
+async def find_address_route(
+    session: AsyncSession, source: int, dest: int, weight: Weight
+) -> list[tuple[float, float]]:
+    """
+    (lat, lon) points of the route between address ids,
+    empty if either address has no intersection or there is no route
+    """
+    endpoints = await _get_route_endpoints(
+        session=session, source=source, dest=dest
+    )
+    if endpoints is None:
+        return []
+    return await _get_cached_route(
+        session=session,
+        source=endpoints[0],
+        target=endpoints[1],
+        weight=weight,
+    )
+
+
+async def _get_cached_route(
+    session: AsyncSession, source: int, target: int, weight: Weight
+) -> list[tuple[float, float]]:
+    """
+    route between intersection osmids, addresses snapped to the same
+    intersections share the cached result
+    """
+    version = await _get_road_version(session=session)
+    if not settings.ROUTE_CACHE_MAX_ITEMS:
+        return await _find_route(
+            session=session, source=source, target=target, weight=weight
+        )
+    _route_cache.set_version(version)
+    key = (source, target, weight)
+    route = _route_cache.get(key)
+    if route is None:
+        route = await _find_route(
+            session=session, source=source, target=target, weight=weight
+        )
+        # dropped if the roads were reloaded while searching the old graph
+        _route_cache.put(key, route, version=version)
+    return route
+
+
+async def _find_route(
+    session: AsyncSession, source: int, target: int, weight: Weight
+) -> list[tuple[float, float]]:
+    if settings.ROUTING_ENGINE in ('csr', 'ch'):
+        return await run_in_threadpool(
+            _get_route_in_memory, source, target, weight
+        )
+    return await _get_route_neo(
+        session=session, source=source, target=target, weight=weight
+    )
+
+
+async def _get_route_neo(
+    session: AsyncSession, source: int, target: int, weight: Weight
+) -> list[tuple[float, float]]:
+    # segments are followed in their direction only, oneway roads
+    # have no reverse segment
     query = '''
-        MATCH (to {id: $dest})-[:NEAREST_INTERSECTION]->(source:Intersection) 
-        MATCH (from {id: $source})-[:NEAREST_INTERSECTION]->(target:Intersection)
+        MATCH (source:Intersection {osmid: $source})
+        MATCH (target:Intersection {osmid: $target})
         CALL
-            apoc.algo.dijkstra(source, target, 'ROAD_SEGMENT', 'length')
+            apoc.algo.dijkstra(source, target, 'ROAD_SEGMENT>', $weight)
         YIELD
             path, weight
         RETURN
             [n in nodes(path) | [n.location.latitude, n.location.longitude]] AS route
     '''
+    params = {'source': source, 'target': target, 'weight': weight}
+    data = await neo_query_async(session, 'route_dijkstra', query, params)
+    if data and data[0]['route']:
+        return data[0]['route']
+    return []
+
+
+def _get_route_in_memory(
+    source: int, target: int, weight: Weight
+) -> list[tuple[float, float]]:
+    """
+    cpu-bound search between intersection osmids,
+    run it in the threadpool to keep the event loop free,
+    the hierarchy is contracted by length, other weights use A*
+    """
+    if settings.ROUTING_ENGINE == 'ch' and weight == 'length':
+        ch = get_contraction_hierarchy()
+        graph, search = ch.up, partial(ch_shortest_path, ch)
+    else:
+        graph = get_road_graph(weight)
+        search = partial(astar, graph)
+    u, v = graph.node_index(source), graph.node_index(target)
+    if u is None or v is None:
+        return []
+    result = search(u, v)
+    if result is None:
+        return []
+    return graph.coordinates(result[1])
+
+
+async def _get_route_endpoints(
+    session: AsyncSession, source: int, dest: int
+) -> tuple[int, int] | None:
+    """
+    osmids of the intersections nearest to source and dest addresses
+    """
+    if settings.USE_SNAPSHOT:
+        snapshot = get_snapshot()
+        u = snapshot.address_intersection(source)
+        v = snapshot.address_intersection(dest)
+        return None if u is None or v is None else (u, v)
+    query = '''
+        MATCH (from {id: $source})-[:NEAREST_INTERSECTION]->(s:Intersection)
+        MATCH (to {id: $dest})-[:NEAREST_INTERSECTION]->(t:Intersection)
+        RETURN s.osmid AS source, t.osmid AS target
+        LIMIT 1
+    '''
     params = {'source': source, 'dest': dest}
-    result = session.run(query=query, parameters=params).data()
-    resp = Route(route=[])
-    if result and result[0]['route']:
-        resp.route = [PointNode(lat=x[0], lon=x[1]) for x in result[0]['route']]
-    return ResponseBody(data=resp)
+    data = await neo_query_async(session, 'route_endpoints', query, params)
+    if not data:
+        return None
+    return data[0]['source'], data[0]['target']
+
 
+async def _get_nearest_intersections(
+    session: AsyncSession, ids: list[int]
+) -> dict[int, int]:
+    """
+    address id -> osmid of its nearest intersection, in one query
+    """
+    if settings.USE_SNAPSHOT:
+        snapshot = get_snapshot()
+        osmids = {x: snapshot.address_intersection(x) for x in set(ids)}
+        return {x: osmid for x, osmid in osmids.items() if osmid is not None}
+    query = '''
+        UNWIND $ids AS id
+        MATCH (a:Address {id: id})-[:NEAREST_INTERSECTION]->(i:Intersection)
+        RETURN a.id AS id, i.osmid AS osmid
+    '''
+    params = {'ids': list(set(ids))}
+    data = await neo_query_async(
+        session, 'route_matrix_endpoints', query, params
+    )
+    return {x['id']: x['osmid'] for x in data}
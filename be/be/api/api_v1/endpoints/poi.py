@@ -1,50 +1,439 @@
+from base64 import urlsafe_b64decode
+from base64 import urlsafe_b64encode
+from dataclasses import dataclass
 from fastapi import APIRouter
+from fastapi import Query
+from fastapi import Request
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+from math import floor
+from neo4j import AsyncDriver
+from neo4j import AsyncSession
+from typing import Annotated
+from typing import Any
+from typing import AsyncIterator
+from typing import Iterable
+from typing import Iterator
+from typing import Literal
 from typing import Sequence
-from be.api.deps import SessionDep
+from starlette.concurrency import run_in_threadpool
+import numpy as np
+import orjson
+from be.config import settings
+from be.api.api_v1.endpoints.address import find_address_route
+from be.api.deps import AsyncSessionDep
+from be.api.responses import dumps
+from be.api.responses import json_response
+from be.api.responses import raw_json_response
+from be.cache import LRUCache
+from be.exc.api import APIError
+from be.geo import corridor
+from be.geo import route_boxes
+from be.neo import cypher_label
+from be.neo import neo_query_async
+from be.neo import neo_stream_async
+from be.poi_index import PoiIndex
+from be.poi_index import PoiRecord
+from be.poi_index import get_poi_index
+from be.poi_index import peek_poi_index
+from be.poi_index import refresh_poi_index
 from be.schemas.http import ResponseBody
+from be.schemas.routing import PoiAlongRoute
+from be.schemas.routing import PoiCorridorQuery
+from be.schemas.routing import PoiNearby
 from be.schemas.routing import PointOfInterest
+from be.schemas.routing import PoiIndexInfo
+from be.utils import iter_batches
+from be.versions import get_dataset_version
 
 
 router = APIRouter()
 
+# rows straight from the driver, or records of the in-memory index,
+# all are encoded as `PointOfInterest` without being validated again
+PoiRow = dict[str, Any] | PoiRecord
+
+PoiFormat = Literal['json', 'ndjson']
+
+# rows per chunk of a streamed ndjson body
+_NDJSON_CHUNK_ROWS = 256
+
+
+@dataclass
+class _Page:
+    """
+    keyset pagination, rows are ordered by (key, id) where key is the
+    distance from the center (circle) or the latitude (polygon),
+    `after` is the (key, id) of the last row of the previous page
+    """
+
+    limit: int | None = None
+    after: tuple[float, int] | None = None
+
+    @classmethod
+    def from_query(
+        cls, limit: int | None, cursor: str | None, format: PoiFormat
+    ) -> '_Page':
+        page = cls(limit=limit, after=_decode_cursor(cursor))
+        if page.paged and format == 'ndjson':
+            # the next cursor is known only once the body has been sent
+            raise APIError(
+                message='limit and cursor are not supported with ndjson',
+                status_code=422,
+            )
+        return page
+
+    @property
+    def paged(self) -> bool:
+        return self.limit is not None or self.after is not None
+
+    def clause(self) -> str:
+        if not self.paged:
+            # unordered, so rows stream out as soon as they are matched
+            return ''
+        if self.limit is None:
+            return '\nORDER BY key, id'
+        return '\nORDER BY key, id\nLIMIT $limit'
+
+    def params(self, lookahead: bool) -> dict[str, Any]:
+        """
+        `lookahead` fetches one extra row to tell if there is a next page
+        """
+        limit = self.limit + lookahead if self.limit is not None else None
+        return {
+            'after': list(self.after) if self.after is not None else None,
+            'limit': limit,
+        }
+
+
+def _encode_cursor(key: float, id_: int) -> str:
+    return urlsafe_b64encode(orjson.dumps([key, id_])).decode('ascii')
+
+
+def _decode_cursor(cursor: str | None) -> tuple[float, int] | None:
+    if cursor is None:
+        return None
+    try:
+        key, id_ = orjson.loads(urlsafe_b64decode(cursor.encode('ascii')))
+        return float(key), int(id_)
+    except (ValueError, TypeError):
+        raise APIError(message='invalid cursor', status_code=422)
+
+
+def _cursor_headers(after: tuple[float, int] | None) -> dict[str, str]:
+    if after is None:
+        return {}
+    return {'X-Next-Cursor': _encode_cursor(*after)}
+
 
 @router.get('/circle')
-def get_poi_circle(
-    session: SessionDep, lat: float, lon: float, radius: float
+async def get_poi_circle(
+    request: Request,
+    session: AsyncSessionDep,
+    lat: float,
+    lon: float,
+    radius: float,
+    limit: Annotated[int | None, Query(ge=1)] = None,
+    cursor: str | None = None,
+    format: PoiFormat = 'json',
 ) -> ResponseBody[Sequence[PointOfInterest]]:
-    query = '''
-        WITH
-            point({latitude: $latitude, longitude:$longitude}) AS radiusCenter
-        MATCH
-            (p:Point)-[:HAS_GEOMETRY]-(poi:PointOfInterest)-[:HAS_TAGS]->(t:Tags) 
-        WHERE
-            point.distance(p.location, radiusCenter) < $radius
-        RETURN p {
-            latitude: p.location.latitude, 
-            longitude: p.location.longitude, 
-            name: poi.name, 
-            categories: labels(poi),
-            tags: t{.*}
-        } 
-        AS point
-    '''
+    """
+    with `limit` or `cursor` POIs are ordered by distance from the center,
+    the `X-Next-Cursor` header of a page is the `cursor` of the next one,
+    `format=ndjson` streams the whole result, one POI per line
+    """
+    page = _Page.from_query(limit=limit, cursor=cursor, format=format)
+    if settings.POI_ENGINE == 'memory':
+        index = get_poi_index()
+        offsets, dist = index.grid.within_radius(
+            lat=lat, lon=lon, radius=radius
+        )
+        return _get_poi_memory_response(
+            index=index, offsets=offsets, keys=dist, page=page, format=format
+        )
+    if settings.POI_SCHEMA == 'compact':
+        query = '''
+            WITH
+                point({latitude: $latitude, longitude:$longitude}) AS radiusCenter
+            MATCH
+                (poi:PointOfInterest)
+            WHERE
+                point.distance(poi.location, radiusCenter) < $radius
+            WITH
+                poi, point.distance(poi.location, radiusCenter) AS key
+            WHERE
+                $after IS NULL
+                OR key > $after[0]
+                OR (key = $after[0] AND poi.id > $after[1])
+            RETURN poi {
+                latitude: poi.location.latitude,
+                longitude: poi.location.longitude,
+                name: poi.name,
+                categories: labels(poi),
+                tags: apoc.convert.fromJsonMap(poi.tags)
+            }
+            AS point, key, poi.id AS id
+        '''
+    else:
+        query = '''
+            WITH
+                point({latitude: $latitude, longitude:$longitude}) AS radiusCenter
+            MATCH
+                (p:Point)-[:HAS_GEOMETRY]-(poi:PointOfInterest)-[:HAS_TAGS]->(t:Tags) 
+            WHERE
+                point.distance(p.location, radiusCenter) < $radius
+            WITH
+                p, poi, t, point.distance(p.location, radiusCenter) AS key
+            WHERE
+                $after IS NULL
+                OR key > $after[0]
+                OR (key = $after[0] AND poi.id > $after[1])
+            RETURN p {
+                latitude: p.location.latitude, 
+                longitude: p.location.longitude, 
+                name: poi.name, 
+                categories: labels(poi),
+                tags: t{.*}
+            } 
+            AS point, key, poi.id AS id
+        '''
     params = {'latitude': lat, 'longitude': lon, 'radius': radius}
-    result = session.run(query=query, parameters=params).data()
-    if not result:
-        return ResponseBody(data=[])
-    pois = [PointOfInterest.from_python(obj.get('point')) for obj in result]
-    return ResponseBody(data=pois)
+    return await _get_poi_neo_response(
+        request=request,
+        session=session,
+        name='poi_circle',
+        query=query,
+        params=params,
+        page=page,
+        format=format,
+    )
 
 
 @router.get('/polygon')
-def get_poi_circle(
-    session: SessionDep,
+async def get_poi_circle(
+    request: Request,
+    session: AsyncSessionDep,
     lat_min: float,
     lat_max: float,
     lon_min: float,
     lon_max: float,
+    limit: Annotated[int | None, Query(ge=1)] = None,
+    cursor: str | None = None,
+    format: PoiFormat = 'json',
 ) -> ResponseBody[Sequence[PointOfInterest]]:
-    query = '''
+    """
+    with `limit` or `cursor` POIs are ordered by latitude,
+    the `X-Next-Cursor` header of a page is the `cursor` of the next one,
+    `format=ndjson` streams the whole result, one POI per line
+    """
+    page = _Page.from_query(limit=limit, cursor=cursor, format=format)
+    if page.paged or format != 'json':
+        # pages and streams bypass the tile cache
+        if settings.POI_ENGINE == 'memory':
+            index = get_poi_index()
+            offsets = index.grid.within_bbox(
+                lat_min=lat_min,
+                lat_max=lat_max,
+                lon_min=lon_min,
+                lon_max=lon_max,
+            )
+            return _get_poi_memory_response(
+                index=index,
+                offsets=offsets,
+                keys=index.grid.lat[offsets],
+                page=page,
+                format=format,
+            )
+        params = {
+            'lat_min': lat_min,
+            'lat_max': lat_max,
+            'lon_min': lon_min,
+            'lon_max': lon_max,
+        }
+        return await _get_poi_neo_response(
+            request=request,
+            session=session,
+            name='poi_bbox',
+            query=_get_poi_bbox_query(),
+            params=params,
+            page=page,
+            format=format,
+        )
+
+    tiles = _get_tile_range(
+        lat_min=lat_min, lat_max=lat_max, lon_min=lon_min, lon_max=lon_max
+    )
+    if not settings.POI_CACHE or \
+            _count_tiles(tiles) > settings.POI_CACHE_MAX_TILES:
+        pois = await _get_poi_bbox(
+            session=session,
+            lat_min=lat_min,
+            lat_max=lat_max,
+            lon_min=lon_min,
+            lon_max=lon_max,
+        )
+        return json_response(pois)
+
+    # the viewport is snapped to whole tiles, so nearby viewports share
+    # the cached tiles, the tiles are cut back to the viewport itself
+    version = await get_dataset_version(session=session, name='poi')
+    etag = f'W/"poi-{version}-' + \
+        '_'.join(map(repr, (lat_min, lat_max, lon_min, lon_max))) + '"'
+    if_none_match = request.headers.get('if-none-match', '')
+    if etag in (tag.strip() for tag in if_none_match.split(',')):
+        return Response(status_code=304, headers={'ETag': etag})
+
+    pois = await _get_poi_tiles(
+        session=session,
+        version=version,
+        tiles=tiles,
+        bbox=(lat_min, lat_max, lon_min, lon_max),
+    )
+    return raw_json_response(pois, headers={'ETag': etag})
+
+
+async def _get_poi_neo_response(
+    request: Request,
+    session: AsyncSession,
+    name: str,
+    query: str,
+    params: dict[str, Any],
+    page: _Page,
+    format: PoiFormat,
+) -> Response:
+    query = query + page.clause()
+    if format == 'ndjson':
+        return StreamingResponse(
+            _stream_poi_ndjson(
+                driver=request.app.state.async_driver,
+                name=name,
+                query=query,
+                params={**params, **page.params(lookahead=False)},
+            ),
+            media_type='application/x-ndjson',
+        )
+
+    params = {**params, **page.params(lookahead=True)}
+    data = await neo_query_async(session, name, query, params)
+    after = None
+    if page.limit is not None and len(data) > page.limit:
+        data = data[:page.limit]
+        after = (data[-1]['key'], data[-1]['id'])
+    return json_response(
+        [obj['point'] for obj in data], headers=_cursor_headers(after)
+    )
+
+
+async def _stream_poi_ndjson(
+    driver: AsyncDriver, name: str, query: str, params: dict[str, Any]
+) -> AsyncIterator[bytes]:
+    """
+    rows are encoded as the driver receives them, the request's session
+    is closed before the body is sent, so the stream opens its own
+    """
+    async with driver.session() as session:
+        lines: list[bytes] = []
+        async for obj in neo_stream_async(session, name, query, params):
+            lines.append(dumps(obj['point']))
+            if len(lines) == _NDJSON_CHUNK_ROWS:
+                yield b'\n'.join(lines) + b'\n'
+                lines = []
+        if lines:
+            yield b'\n'.join(lines) + b'\n'
+
+
+def _get_poi_memory_response(
+    index: PoiIndex,
+    offsets: np.ndarray,
+    keys: np.ndarray,
+    page: _Page,
+    format: PoiFormat,
+) -> Response:
+    """
+    `offsets` into the index records with the sort `keys` of the page,
+    POI ids break ties as in Neo4j, so cursors outlive an index refresh
+    """
+    after = None
+    if page.paged:
+        ids = index.ids[offsets]
+        order = np.lexsort((ids, keys))
+        offsets, keys, ids = offsets[order], keys[order], ids[order]
+        if page.after is not None:
+            key, id_ = page.after
+            mask = (keys > key) | ((keys == key) & (ids > id_))
+            offsets, keys, ids = offsets[mask], keys[mask], ids[mask]
+        if page.limit is not None and len(offsets) > page.limit:
+            offsets, keys = offsets[:page.limit], keys[:page.limit]
+            after = (float(keys[-1]), int(ids[page.limit - 1]))
+
+    # records of a snapshot are spliced in as they are stored
+    pois = (index.records[i] for i in offsets.tolist())
+    if format == 'ndjson':
+        return StreamingResponse(
+            _iter_poi_ndjson(pois), media_type='application/x-ndjson'
+        )
+    return json_response(list(pois), headers=_cursor_headers(after))
+
+
+def _iter_poi_ndjson(pois: Iterable[PoiRow]) -> Iterator[bytes]:
+    for batch in iter_batches(pois, _NDJSON_CHUNK_ROWS):
+        yield b''.join(dumps(poi) + b'\n' for poi in batch)
+
+
+async def _get_poi_bbox(
+    session: AsyncSession,
+    lat_min: float,
+    lat_max: float,
+    lon_min: float,
+    lon_max: float,
+) -> Sequence[PoiRow]:
+    if settings.POI_ENGINE == 'memory':
+        return get_poi_index().within_bbox(
+            lat_min=lat_min,
+            lat_max=lat_max,
+            lon_min=lon_min,
+            lon_max=lon_max,
+        )
+    params = {
+        'lat_min': lat_min,
+        'lat_max': lat_max,
+        'lon_min': lon_min,
+        'lon_max': lon_max,
+        **_Page().params(lookahead=False),
+    }
+    data = await neo_query_async(
+        session, 'poi_bbox', _get_poi_bbox_query(), params
+    )
+    return [obj['point'] for obj in data]
+
+
+def _get_poi_bbox_query() -> str:
+    if settings.POI_SCHEMA == 'compact':
+        return '''
+            MATCH
+                (poi:PointOfInterest)
+            WHERE
+                point.withinBBox(
+                    poi.location,
+                    point({longitude: $lon_min, latitude: $lat_min }),
+                    point({longitude: $lon_max, latitude: $lat_max})
+                )
+            WITH
+                poi, poi.location.latitude AS key
+            WHERE
+                $after IS NULL
+                OR key > $after[0]
+                OR (key = $after[0] AND poi.id > $after[1])
+            RETURN poi {
+                latitude: poi.location.latitude,
+                longitude: poi.location.longitude,
+                name: poi.name,
+                categories: labels(poi),
+                tags: apoc.convert.fromJsonMap(poi.tags)
+            }
+            AS point, key, poi.id AS id
+        '''
+    return '''
         MATCH
             (p:Point)-[:HAS_GEOMETRY]-(poi:PointOfInterest)-[:HAS_TAGS]->(t:Tags) 
         WHERE
@@ -53,6 +442,12 @@ def get_poi_circle(
                 point({longitude: $lon_min, latitude: $lat_min }), 
                 point({longitude: $lon_max, latitude: $lat_max})
             )
+        WITH
+            p, poi, t, p.location.latitude AS key
+        WHERE
+            $after IS NULL
+            OR key > $after[0]
+            OR (key = $after[0] AND poi.id > $after[1])
         RETURN p {
             latitude: p.location.latitude, 
             longitude: p.location.longitude, 
@@ -60,16 +455,465 @@ def get_poi_circle(
             categories: labels(poi),
             tags: t{.*}
         } 
+        AS point, key, poi.id AS id
+    '''
+
+
+@dataclass
+class _Tile:
+    """
+    encoded POIs of a tile, comma separated without the enclosing brackets,
+    the i-th POI at `lat[i]`, `lon[i]` is `data[starts[i]:ends[i]]`
+    """
+
+    data: bytes
+    starts: np.ndarray
+    ends: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+
+    @classmethod
+    def encode(
+        cls, pois: Sequence[PoiRow], lat: np.ndarray, lon: np.ndarray
+    ) -> '_Tile':
+        encoded = [dumps(poi) for poi in pois]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64)
+        # every POI but the first follows a comma
+        ends = np.cumsum(lengths + 1) - 1
+        return cls(
+            data=b','.join(encoded),
+            starts=ends - lengths,
+            ends=ends,
+            lat=lat,
+            lon=lon,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + sum(
+            arr.nbytes for arr in (self.starts, self.ends, self.lat, self.lon)
+        )
+
+    def within_bbox(
+        self, lat_min: float, lat_max: float, lon_min: float, lon_max: float
+    ) -> bytes:
+        """
+        the encoded POIs within the bbox (inclusive), sliced out of `data`
+        """
+        mask = (self.lat >= lat_min) & (self.lat <= lat_max) & \
+            (self.lon >= lon_min) & (self.lon <= lon_max)
+        if mask.all():
+            return self.data
+        return b','.join(
+            self.data[start:end] for start, end
+            in zip(self.starts[mask].tolist(), self.ends[mask].tolist())
+        )
+
+
+_tile_cache: LRUCache[tuple[int, float, int, int], _Tile] = \
+    LRUCache(
+        max_bytes=settings.POI_CACHE_MAX_BYTES,
+        sizeof=lambda tile: tile.nbytes,
+    )
+
+
+def _get_tile_range(
+    lat_min: float,
+    lat_max: float,
+    lon_min: float,
+    lon_max: float,
+) -> tuple[int, int, int, int]:
+    """
+    (row_min, row_max, col_min, col_max) of the tiles covering a bbox
+    """
+    size = settings.POI_CACHE_TILE_SIZE
+    return (
+        floor(lat_min / size),
+        floor(lat_max / size),
+        floor(lon_min / size),
+        floor(lon_max / size),
+    )
+
+
+def _count_tiles(tiles: tuple[int, int, int, int]) -> int:
+    return max(tiles[1] - tiles[0] + 1, 0) * max(tiles[3] - tiles[2] + 1, 0)
+
+
+def _get_tile_runs(
+    keys: Iterable[tuple[int, float, int, int]]
+) -> list[list[float]]:
+    """
+    [lat_min, lat_max, lon_min, lon_max] of every run of adjacent tiles
+    in a row, runs over the same columns of consecutive rows are merged
+    """
+    size = settings.POI_CACHE_TILE_SIZE
+    runs: list[list[int]] = []
+    for _, _, row, col in sorted(keys, key=lambda key: (key[2], key[3])):
+        if runs and runs[-1][0] == row and runs[-1][3] == col - 1:
+            runs[-1][3] = col
+        else:
+            runs.append([row, row, col, col])
+    # the last box of every column span, extended while rows follow
+    spans: dict[tuple[int, int], list[int]] = {}
+    boxes: list[list[int]] = []
+    for row, _, col_min, col_max in runs:
+        box = spans.get((col_min, col_max))
+        if box is not None and box[1] == row - 1:
+            box[1] = row
+        else:
+            box = [row, row, col_min, col_max]
+            spans[(col_min, col_max)] = box
+            boxes.append(box)
+    return [
+        [r0 * size, (r1 + 1) * size, c0 * size, (c1 + 1) * size]
+        for r0, r1, c0, c1 in boxes
+    ]
+
+
+async def _get_poi_tiles(
+    session: AsyncSession,
+    version: int,
+    tiles: tuple[int, int, int, int],
+    bbox: tuple[float, float, float, float],
+) -> bytes:
+    """
+    encoded json array of the POIs within `bbox` from the tiles in range,
+    tiles missing from the cache are fetched in one query with a box per
+    run of adjacent missing tiles
+    """
+    size = settings.POI_CACHE_TILE_SIZE
+    keys = [
+        (version, size, row, col)
+        for row in range(tiles[0], tiles[1] + 1)
+        for col in range(tiles[2], tiles[3] + 1)
+    ]
+    cached: dict[tuple[int, float, int, int], _Tile] = {}
+    # offsets of the fetched POIs per missing tile
+    missing: dict[tuple[int, float, int, int], list[int]] = {}
+    for key in keys:
+        tile = _tile_cache.get(key)
+        if tile is None:
+            missing[key] = []
+        else:
+            cached[key] = tile
+    if missing:
+        pois, lat, lon = await _get_poi_boxes(
+            session=session, boxes=_get_tile_runs(missing)
+        )
+        rows = np.floor(lat / size).astype(np.int64).tolist()
+        cols = np.floor(lon / size).astype(np.int64).tolist()
+        for i, (row, col) in enumerate(zip(rows, cols)):
+            offsets = missing.get((version, size, row, col))
+            if offsets is not None:
+                offsets.append(i)
+        for key, offsets in missing.items():
+            cached[key] = _Tile.encode(
+                [pois[i] for i in offsets], lat[offsets], lon[offsets]
+            )
+            _tile_cache.put(key, cached[key])
+    parts = (cached[key].within_bbox(*bbox) for key in keys)
+    return b'[' + b','.join(part for part in parts if part) + b']'
+
+
+async def _get_poi_boxes(
+    session: AsyncSession, boxes: list[list[float]]
+) -> tuple[Sequence[PoiRow], np.ndarray, np.ndarray]:
+    """
+    POIs within any of the [lat_min, lat_max, lon_min, lon_max] boxes,
+    once, and their coordinates
+    """
+    if settings.POI_ENGINE == 'memory':
+        index = get_poi_index()
+        offsets = np.unique(np.concatenate([
+            index.grid.within_bbox(*box) for box in boxes
+        ]))
+        return (
+            [index.records[i] for i in offsets.tolist()],
+            index.grid.lat[offsets],
+            index.grid.lon[offsets],
+        )
+    params = {'boxes': boxes, 'categories': []}
+    data = await neo_query_async(
+        session, 'poi_tiles', _get_poi_boxes_query(), params
+    )
+    pois = [obj['point'] for obj in data]
+    return (
+        pois,
+        np.fromiter((p['latitude'] for p in pois), dtype=np.float64),
+        np.fromiter((p['longitude'] for p in pois), dtype=np.float64),
+    )
+
+
+@router.get('/nearest')
+async def get_poi_nearest(
+    session: AsyncSessionDep,
+    lat: float,
+    lon: float,
+    k: Annotated[int, Query(ge=1, le=settings.POI_NEAREST_MAX_K)] = 5,
+    category: str | None = None,
+) -> ResponseBody[Sequence[PoiNearby]]:
+    """
+    the `k` POIs nearest to the point ordered by distance, `category` is
+    a class or subclass label (e.g. `amenity` or `pharmacy`), fewer than `k`
+    only if there aren't that many (within `POI_NEAREST_MAX_RADIUS` in Neo4j)
+    """
+    label = category or 'PointOfInterest'
+    if settings.POI_ENGINE == 'memory':
+        pois, dist = await run_in_threadpool(
+            get_poi_index().nearest, lat, lon, k, label
+        )
+        return json_response([
+            {'poi': poi, 'distance': d} for poi, d in zip(pois, dist.tolist())
+        ])
+
+    # all POIs within the radius are ordered, so once it holds k of them
+    # they are the k nearest
+    query = _get_poi_nearest_query(label)
+    radius = settings.POI_NEAREST_RADIUS
+    while True:
+        params = {'latitude': lat, 'longitude': lon, 'radius': radius, 'k': k}
+        data = await neo_query_async(session, 'poi_nearest', query, params)
+        if len(data) >= k or radius >= settings.POI_NEAREST_MAX_RADIUS:
+            break
+        radius = min(radius * 2, settings.POI_NEAREST_MAX_RADIUS)
+    return json_response([
+        {'poi': obj['point'], 'distance': obj['distance']} for obj in data
+    ])
+
+
+def _get_poi_nearest_query(label: str) -> str:
+    # the label is part of the query text, so the planner can use its
+    # point index (compact layout), the graph layout seeks the point index
+    # of :Point(location) and checks the label of the POI
+    if settings.POI_SCHEMA == 'compact':
+        return f'''
+            WITH
+                point({{latitude: $latitude, longitude: $longitude}}) AS center
+            MATCH
+                (poi:{cypher_label(label)})
+            WHERE
+                point.distance(poi.location, center) < $radius
+                AND poi:PointOfInterest
+            WITH
+                poi, point.distance(poi.location, center) AS distance
+            ORDER BY distance, poi.id
+            LIMIT $k
+            RETURN poi {{
+                latitude: poi.location.latitude,
+                longitude: poi.location.longitude,
+                name: poi.name,
+                categories: labels(poi),
+                tags: apoc.convert.fromJsonMap(poi.tags)
+            }}
+            AS point, distance
+        '''
+    return f'''
+        WITH
+            point({{latitude: $latitude, longitude: $longitude}}) AS center
+        MATCH
+            (p:Point)-[:HAS_GEOMETRY]-(poi:PointOfInterest)-[:HAS_TAGS]->(t:Tags)
+        WHERE
+            point.distance(p.location, center) < $radius
+            AND poi:{cypher_label(label)}
+        WITH
+            p, poi, t, point.distance(p.location, center) AS distance
+        ORDER BY distance, poi.id
+        LIMIT $k
+        RETURN p {{
+            latitude: p.location.latitude,
+            longitude: p.location.longitude,
+            name: poi.name,
+            categories: labels(poi),
+            tags: t{{.*}}
+        }}
+        AS point, distance
+    '''
+
+
+@router.post('/corridor')
+async def get_poi_corridor(
+    session: AsyncSessionDep, body: PoiCorridorQuery
+) -> ResponseBody[Sequence[PoiAlongRoute]]:
+    """
+    POIs within `width` meters of a route ordered by their position along it,
+    the route is given as points or computed between the `source` and `dest`
+    addresses, candidates come from one spatial query over a box per run
+    of route segments and are tested against those segments in one pass
+    """
+    if body.route is not None:
+        route = [(p.lat, p.lon) for p in body.route]
+    elif body.source is not None and body.dest is not None:
+        route = await find_address_route(
+            session=session,
+            source=body.source,
+            dest=body.dest,
+            weight=body.weight,
+        )
+    else:
+        raise APIError(
+            message='either route or source and dest are required',
+            status_code=422,
+        )
+    # width and given routes are validated by the schema, a computed
+    # route is known only now
+    if len(route) > settings.POI_CORRIDOR_MAX_POINTS:
+        raise APIError(
+            message=f'at most {settings.POI_CORRIDOR_MAX_POINTS} route points',
+            status_code=422,
+        )
+    if not route:
+        return json_response([])
+
+    points = np.array(route, dtype=np.float64).reshape(-1, 2)
+    boxes = route_boxes(points[:, 0], points[:, 1], body.width)
+    if settings.POI_ENGINE == 'memory':
+        index = get_poi_index()
+        # the grids of the wanted labels hold only POIs of those labels
+        grids = [
+            index.label_grids[c] for c in body.categories
+            if c in index.label_grids
+        ] if body.categories else [index.grid]
+        offsets = np.unique(np.concatenate([
+            grid.within_bbox(*box) for grid in grids for box in boxes.tolist()
+        ] or [np.empty(0, dtype=np.int64)]))
+        pois: Sequence[PoiRow] = index.records
+        lat, lon = index.grid.lat[offsets], index.grid.lon[offsets]
+    else:
+        params = {'boxes': boxes.tolist(), 'categories': body.categories}
+        data = await neo_query_async(
+            session, 'poi_corridor', _get_poi_boxes_query(), params
+        )
+        pois = [obj['point'] for obj in data]
+        offsets = np.arange(len(pois))
+        lat = np.fromiter((p['latitude'] for p in pois), dtype=np.float64)
+        lon = np.fromiter((p['longitude'] for p in pois), dtype=np.float64)
+    along_route = await run_in_threadpool(
+        _get_poi_along_route,
+        pois,
+        offsets,
+        lat,
+        lon,
+        points,
+        body.width,
+    )
+    return json_response(along_route)
+
+
+def _get_poi_along_route(
+    pois: Sequence[PoiRow],
+    offsets: np.ndarray,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    route: np.ndarray,
+    width: float,
+) -> list[dict[str, Any]]:
+    """
+    `offsets` into `pois` of the candidates at `lat`, `lon`, candidates
+    are of the wanted categories already
+    """
+    found, along, dist = corridor(lat, lon, route[:, 0], route[:, 1], width)
+    return [
+        {'poi': pois[i], 'along': a, 'distance': d}
+        for i, a, d in zip(
+            offsets[found].tolist(), along.tolist(), dist.tolist()
+        )
+    ]
+
+
+def _get_poi_boxes_query() -> str:
+    # boxes are [lat_min, lat_max, lon_min, lon_max], POIs in several
+    # overlapping boxes are returned once
+    if settings.POI_SCHEMA == 'compact':
+        return '''
+            UNWIND $boxes AS box
+            MATCH
+                (poi:PointOfInterest)
+            WHERE
+                point.withinBBox(
+                    poi.location,
+                    point({longitude: box[2], latitude: box[0]}),
+                    point({longitude: box[3], latitude: box[1]})
+                )
+                AND (
+                    size($categories) = 0
+                    OR any(c IN labels(poi) WHERE c IN $categories)
+                )
+            WITH DISTINCT
+                poi
+            RETURN poi {
+                latitude: poi.location.latitude,
+                longitude: poi.location.longitude,
+                name: poi.name,
+                categories: labels(poi),
+                tags: apoc.convert.fromJsonMap(poi.tags)
+            }
+            AS point
+        '''
+    return '''
+        UNWIND $boxes AS box
+        MATCH
+            (p:Point)-[:HAS_GEOMETRY]-(poi:PointOfInterest)
+        WHERE
+            point.withinBBox(
+                p.location,
+                point({longitude: box[2], latitude: box[0]}),
+                point({longitude: box[3], latitude: box[1]})
+            )
+            AND (
+                size($categories) = 0
+                OR any(c IN labels(poi) WHERE c IN $categories)
+            )
+        WITH DISTINCT
+            p, poi
+        MATCH
+            (poi)-[:HAS_TAGS]->(t:Tags)
+        RETURN p {
+            latitude: p.location.latitude,
+            longitude: p.location.longitude,
+            name: poi.name,
+            categories: labels(poi),
+            tags: t{.*}
+        }
         AS point
     '''
-    params = {
-        'lat_min': lat_min,
-        'lat_max': lat_max,
-        'lon_min': lon_min,
-        'lon_max': lon_max,
-    }
-    result = session.run(query=query, parameters=params).data()
-    if not result:
-        return ResponseBody(data=[])
-    pois = [PointOfInterest.from_python(obj.get('point')) for obj in result]
-    return ResponseBody(data=pois)
\ No newline at end of file
+
+
+@router.get('/index')
+async def get_poi_index_info() -> ResponseBody[PoiIndexInfo]:
+    """
+    409 unless `POI_ENGINE=memory` has built the index, POIs are never
+    loaded into the api process just to report on them
+    """
+    return ResponseBody(data=_poi_index_info(_get_built_poi_index()))
+
+
+@router.post('/index/refresh')
+async def refresh_poi_index_info() -> ResponseBody[PoiIndexInfo]:
+    """
+    rebuild the index `POI_ENGINE=memory` serves from, 409 if there is none
+    """
+    _get_built_poi_index()
+    index = await run_in_threadpool(refresh_poi_index)
+    return ResponseBody(data=_poi_index_info(index))
+
+
+def _get_built_poi_index() -> PoiIndex:
+    if settings.POI_ENGINE != 'memory':
+        raise APIError(
+            message='no POI index is built unless POI_ENGINE is memory',
+            status_code=409,
+        )
+    index = peek_poi_index()
+    if index is None:
+        raise APIError(
+            message='the POI index is not built yet', status_code=409
+        )
+    return index
+
+
+def _poi_index_info(index: PoiIndex) -> PoiIndexInfo:
+    return PoiIndexInfo(
+        size=len(index.records),
+        memory_bytes=index.nbytes,
+        built_at=index.built_at,
+    )
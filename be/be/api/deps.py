@@ -1,6 +1,9 @@
 from neo4j import Session
+from neo4j import AsyncSession
 from fastapi import Depends
+from fastapi import Request
 from typing import Generator
+from typing import AsyncGenerator
 from typing import Annotated
 from be.neo import driver
 
@@ -12,4 +15,15 @@ def get_db() -> Generator[Session, None, None]:
     finally:
         db.close()
 
-SessionDep = Annotated[Session, Depends(get_db)]
\ No newline at end of file
+
+async def get_async_db(
+    request: Request
+) -> AsyncGenerator[AsyncSession, None]:
+    db = request.app.state.async_driver.session()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
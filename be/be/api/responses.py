@@ -0,0 +1,49 @@
+"""
+responses encoded with orjson straight from plain rows, endpoints keep
+their `ResponseBody[...]` annotation so the OpenAPI schema stays the same,
+but data built by the api itself is not validated again
+"""
+from datetime import datetime
+from typing import Any
+from fastapi import Response
+from pydantic import BaseModel
+import orjson
+
+
+def dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_encode_model)
+
+
+def _encode_model(obj: Any) -> Any:
+    # field values only, nested models are handled by the next call
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError(f'{type(obj).__name__} is not JSON serializable')
+
+
+def json_response(
+    data: Any, headers: dict[str, str] | None = None
+) -> Response:
+    """
+    same body as `ResponseBody(data=data)`
+    """
+    return raw_json_response(dumps(data), headers=headers)
+
+
+def raw_json_response(
+    data: bytes, headers: dict[str, str] | None = None
+) -> Response:
+    """
+    `data` is already encoded json, e.g. spliced from cached fragments
+    """
+    timestamp = orjson.dumps(datetime.utcnow().timestamp() * 1000.0)
+    body = b''.join((
+        b'{"success":true,"error":false,"message":null,"errors":null,"data":',
+        data,
+        b',"timestamp":',
+        timestamp,
+        b'}',
+    ))
+    return Response(
+        content=body, media_type='application/json', headers=headers
+    )
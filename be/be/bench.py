@@ -0,0 +1,233 @@
+"""
+ETL benchmarks, every stage runs in a fresh process
+so its peak RSS is not inflated by the previous ones
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+from typing import Literal
+from be.config import settings
+from be.utils import Dataset
+
+
+Stage = Literal['parse', 'batch', 'insert', 'load']
+DriverKind = Literal['memory', 'neo']
+
+STAGES: tuple[Stage, ...] = ('parse', 'batch', 'insert', 'load')
+
+# dataset -> its loader in be.neo
+DATASETS: dict[Dataset, str] = {
+    'road_nodes': 'load_prague_road_nodes',
+    'road_rels': 'load_prague_road_rels',
+    'address': 'load_prague_address_nodes',
+    'poi': 'load_prague_poi',
+}
+
+
+class MemorySummary:
+    result_available_after: int | None = None
+    result_consumed_after: int | None = None
+
+
+class MemoryResult:
+
+    def __init__(self, records: list[dict[str, Any]]) -> None:
+        self.records = records
+
+    def data(self) -> list[dict[str, Any]]:
+        return self.records
+
+    def values(self) -> list[list[Any]]:
+        return [list(r.values()) for r in self.records]
+
+    def single(self) -> dict[str, Any] | None:
+        return self.records[0] if self.records else None
+
+    def consume(self) -> MemorySummary:
+        return MemorySummary()
+
+
+class MemoryTransaction:
+    """
+    stand-in for `neo4j.ManagedTransaction`, batch queries report
+    every row of `$data` as written
+    """
+
+    def run(
+        self, query: str, parameters: dict[str, Any] | None = None
+    ) -> MemoryResult:
+        data = (parameters or {}).get('data')
+        if data is None:
+            return MemoryResult([])
+        return MemoryResult([{'total': sum(1 for _ in data)}])
+
+
+class MemorySession(MemoryTransaction):
+
+    def __enter__(self) -> 'MemorySession':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        return None
+
+    def close(self) -> None:
+        return None
+
+    def execute_write(self, func: Any, *args: Any, **kwargs: Any) -> Any:
+        return func(MemoryTransaction(), *args, **kwargs)
+
+    execute_read = execute_write
+
+
+class MemoryDriver:
+    """
+    stand-in for `neo4j.Driver`, measures the client side of loading only
+    """
+
+    def session(self, **kwargs: Any) -> MemorySession:
+        return MemorySession()
+
+    def close(self) -> None:
+        return None
+
+
+def run_benchmarks(
+    data_dir: Path | str,
+    driver: DriverKind = 'memory',
+    batch_size: int = 10000,
+    datasets: list[Dataset] | None = None,
+) -> dict[str, Any]:
+    """
+    time every stage of every dataset in `data_dir`, returns a json-ready
+    report with rows/s and peak RSS per stage
+    """
+    report: dict[str, Any] = {
+        'data_dir': str(data_dir),
+        'driver': driver,
+        'batch_size': batch_size,
+        'format': settings.DS_FORMAT,
+        'datasets': {},
+    }
+    for dataset in datasets or list(DATASETS):
+        report['datasets'][dataset] = {}
+        for stage in STAGES:
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=get_context('spawn')
+            ) as executor:
+                result = executor.submit(
+                    run_stage, stage, dataset, str(data_dir), driver, batch_size
+                ).result()
+            report['datasets'][dataset][stage] = result
+    return report
+
+
+def run_stage(
+    stage: Stage,
+    dataset: Dataset,
+    data_dir: str,
+    driver: DriverKind,
+    batch_size: int,
+) -> dict[str, Any]:
+    from resource import getrusage
+    from resource import RUSAGE_SELF
+    from be import neo
+    from be.utils import iter_batches
+    from be.utils import iter_dataset
+
+    settings.DATA_DIR = Path(data_dir)
+    if driver == 'memory':
+        neo.driver = MemoryDriver()  # type: ignore [assignment]
+    loader = DATASETS[dataset]
+
+    # inputs of later stages are prepared outside of the timed section
+    records: list[dict[str, Any]] = []
+    if stage in ('batch', 'insert'):
+        records = list(iter_dataset(dataset))
+    if stage == 'insert':
+        # the loader runs on already parsed rows
+        neo.iter_dataset = lambda dataset: iter(records)
+    rows = len(records) if records else \
+        sum(1 for _ in iter_dataset(dataset))
+
+    baseline_rss = getrusage(RUSAGE_SELF).ru_maxrss
+    start = perf_counter()
+    if stage == 'parse':
+        for _ in iter_dataset(dataset):
+            pass
+    elif stage == 'batch':
+        for _ in iter_batches(records, batch_size):
+            pass
+    else:
+        getattr(neo, loader)()
+    seconds = perf_counter() - start
+
+    return {
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_s': rows / seconds if seconds else None,
+        'baseline_rss_kb': baseline_rss,
+        'peak_rss_kb': getrusage(RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_serialization_benchmark(
+    data_dir: Path | str, rows: int | None = None, repeat: int = 3
+) -> dict[str, Any]:
+    """
+    per-row cost of a `/poi` response body built from driver rows,
+    'pydantic' validates every row into a model, validates the response
+    and encodes it the way FastAPI does, 'orjson' encodes the rows as they are
+    """
+    from asyncio import run
+    from itertools import islice
+    from typing import Sequence
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+    from be.api.responses import json_response
+    from be.schemas.http import ResponseBody
+    from be.schemas.routing import PointOfInterest
+    from be.utils import iter_dataset
+
+    settings.DATA_DIR = Path(data_dir)
+    # the shape returned by the /poi queries
+    points = [
+        {
+            'latitude': r['lat'],
+            'longitude': r['lon'],
+            'name': r['name'] or '',
+            'categories': ['PointOfInterest', r['class'], r['subclass']],
+            'tags': r['tags'],
+        }
+        for r in islice(iter_dataset('poi'), rows)
+    ]
+    field = create_response_field(
+        name='response', type_=ResponseBody[Sequence[PointOfInterest]]
+    )
+
+    def encode_pydantic() -> bytes:
+        pois = [PointOfInterest.from_python(p) for p in points]
+        content = run(serialize_response(
+            field=field, response_content=ResponseBody(data=pois)
+        ))
+        return JSONResponse(content).body
+
+    def encode_orjson() -> bytes:
+        return json_response(points).body
+
+    report: dict[str, Any] = {'rows': len(points)}
+    for name, encode in (('pydantic', encode_pydantic),
+                         ('orjson', encode_orjson)):
+        seconds = []
+        for _ in range(repeat):
+            start = perf_counter()
+            body = encode()
+            seconds.append(perf_counter() - start)
+        report[name] = {
+            'seconds': min(seconds),
+            'us_per_row': min(seconds) / len(points) * 1e6 if points else None,
+            'bytes': len(body),
+        }
+    return report
@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import Callable
+from typing import Generic
+from typing import Hashable
+from typing import TypeVar
+
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    items: int = 0
+    nbytes: int = 0
+
+
+class LRUCache(Generic[K, V]):
+    """
+    thread-safe least-recently-used cache bounded by item count and/or
+    total size (as reported by `sizeof`), entries expire after `ttl` seconds
+    """
+
+    def __init__(
+        self,
+        max_items: int | None = None,
+        max_bytes: int | None = None,
+        ttl: float | None = None,
+        sizeof: Callable[[V], int] = lambda _: 0,
+    ) -> None:
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._data: OrderedDict[K, tuple[V, int, float]] = OrderedDict()
+        self._lock = Lock()
+        self._stats = CacheStats()
+        self._version: int | None = None
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl is not None and \
+                    monotonic() - entry[2] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._stats.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats.hits += 1
+            return entry[0]
+
+    def put(self, key: K, value: V, version: int | None = None) -> None:
+        """
+        `version` of the data the value was computed from, a value computed
+        before the version changed is not stored
+        """
+        size = self.sizeof(value)
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, monotonic())
+            self._stats.items += 1
+            self._stats.nbytes += size
+            while self._data and (
+                (self.max_items is not None
+                    and self._stats.items > self.max_items)
+                or (self.max_bytes is not None
+                    and self._stats.nbytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._data)))
+                self._stats.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._stats.items = self._stats.nbytes = 0
+
+    def set_version(self, version: int) -> None:
+        """
+        clear the cache when the version of the data it holds changes
+        """
+        with self._lock:
+            if self._version == version:
+                return
+            self._version = version
+            self._data.clear()
+            self._stats.items = self._stats.nbytes = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(**vars(self._stats))
+
+    def _remove(self, key: K) -> None:
+        _, size, _ = self._data.pop(key)
+        self._stats.items -= 1
+        self._stats.nbytes -= size
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from pathlib import Path
+from typing import Literal
 
 
 _BASE_DIR = Path(__file__).resolve().parent.parent
@@ -21,14 +22,76 @@ class Settings(BaseSettings):
     NEO_DATABASE: str = 'neo4j'
     NEO_USERNAME: str = 'neo4j'
     NEO_PASSWORD: str
+    NEO_MAX_CONNECTION_POOL_SIZE: int = 500
 
     DS_POI_PRG_NODES_FILENAME: str = 'prague_det_poi_nodes.csv'
     DS_ADDRESS_PRG_NODES_FILENAME: str = 'prague_address_nodes.csv'
     DS_ROAD_PRG_NODES_FILENAME: str = 'prague_road_nodes.csv'
     DS_ROAD_PRG_RELS_FILENAME: str = 'prague_road_relationships.csv'
+    DS_ROAD_PRG_CH_FILENAME: str = 'prague_road_ch.npz'
+    # 'jsonl' downloads and loads typed json lines (same names, .jsonl)
+    # instead of csv with repr-encoded tags
+    DS_FORMAT: Literal['csv', 'jsonl'] = 'csv'
+
+    # overpass responses are cached per query in DATA_DIR/overpass,
+    # delete the directory to download fresh data
+    OSM_OVERPASS_URL: str = 'https://overpass-api.de/api/interpreter'
+    OSM_DOWNLOAD_WORKERS: int = 2
+    OSM_DOWNLOAD_RETRIES: int = 5
+
+    # serve road graph, POI index and address lookups from the
+    # memory-mapped file written by `cli.py snapshot build`
+    USE_SNAPSHOT: bool = False
+    SNAPSHOT_FILENAME: str = 'snapshot.bin'
 
     API_V1_PREFIX: str = '/api/v1'
     API_ALLOW_DOCS: bool = True
+    # latency histograms per route and per named Cypher query at GET /metrics
+    METRICS_ENABLED: bool = True
+
+    # 'neo' runs apoc.algo.dijkstra, 'csr' searches an in-process road graph,
+    # 'ch' queries the contraction hierarchy built by `cli.py db build-ch`
+    ROUTING_ENGINE: Literal['neo', 'csr', 'ch'] = 'neo'
+    ROUTING_GRAPH_SOURCE: Literal['neo', 'csv'] = 'neo'
+
+    # computed routes by (source, target) intersection, 0 disables the cache
+    ROUTE_CACHE_MAX_ITEMS: int = 10000
+    ROUTE_CACHE_TTL: float = 3600.0
+
+    # POST /address/route/matrix searches the in-process road graph,
+    # one search per source spread over this many processes (1 runs inline)
+    ROUTE_MATRIX_WORKERS: int = 4
+    ROUTE_MATRIX_MAX_SIZE: int = 100
+
+    # GET /address/isochrone always searches the in-process road graph,
+    # whatever the ROUTING_ENGINE, results are cached by (intersection,
+    # distance, weight), 0 disables the cache
+    ISOCHRONE_MAX_DISTANCE: float = 20000.0
+    ISOCHRONE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    ISOCHRONE_CACHE_TTL: float = 3600.0
+
+    # 'graph' keeps POI geometry and tags in separate nodes,
+    # 'compact' stores them on the indexed PointOfInterest node
+    POI_SCHEMA: Literal['graph', 'compact'] = 'graph'
+    # 'memory' answers viewport queries from an in-process grid index
+    POI_ENGINE: Literal['neo', 'memory'] = 'neo'
+    POI_INDEX_CELL_SIZE: float = 250.0
+    # /poi/polygon responses assembled from cached tiles of this size (degrees)
+    POI_CACHE: bool = False
+    POI_CACHE_TILE_SIZE: float = 0.02
+    POI_CACHE_MAX_TILES: int = 1024
+    POI_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    # POST /poi/corridor, meters either side of the route and route points
+    POI_CORRIDOR_MAX_WIDTH: float = 2000.0
+    POI_CORRIDOR_MAX_POINTS: int = 10000
+    # GET /poi/nearest, the Neo4j search starts at the initial radius (meters)
+    # and doubles it until k POIs are found or the maximum is reached
+    POI_NEAREST_MAX_K: int = 100
+    POI_NEAREST_RADIUS: float = 500.0
+    POI_NEAREST_MAX_RADIUS: float = 64000.0
+
+    # seconds between checks for datasets reloaded by `cli.py db load`
+    DATASET_VERSION_TTL: float = 5.0
     
 
 settings = Settings()
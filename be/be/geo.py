@@ -0,0 +1,229 @@
+import numpy as np
+
+
+EARTH_RADIUS_M = 6_371_000.0
+
+
+def haversine(
+    lat1: np.ndarray | float,
+    lon1: np.ndarray | float,
+    lat2: np.ndarray | float,
+    lon2: np.ndarray | float,
+) -> np.ndarray:
+    """
+    great-circle distance in meters, broadcasts over numpy arrays
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def project(
+    lat: np.ndarray, lon: np.ndarray, lat_origin: float
+) -> np.ndarray:
+    """
+    equirectangular projection to meters around `lat_origin`,
+    accurate enough for distances within a city, returns (n, 2) array of x, y
+    """
+    x = np.radians(lon) * EARTH_RADIUS_M * np.cos(np.radians(lat_origin))
+    y = np.radians(lat) * EARTH_RADIUS_M
+    return np.column_stack([x, y])
+
+
+def snap_to_nearest(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    target_lat: np.ndarray,
+    target_lon: np.ndarray,
+    max_distance: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    index of the nearest target of every point and the distance to it
+    in meters, one KD-tree query for all points,
+    index is -1 (and distance inf) if no target is within `max_distance`
+    """
+    from scipy.spatial import cKDTree
+    lat_origin = float(target_lat.mean())
+    tree = cKDTree(project(target_lat, target_lon, lat_origin))
+    dist, idx = tree.query(
+        project(lat, lon, lat_origin), k=1, distance_upper_bound=max_distance
+    )
+    found = np.isfinite(dist)
+    idx = np.where(found, idx, -1)
+    length = np.full(len(lat), np.inf)
+    length[found] = haversine(
+        lat[found], lon[found], target_lat[idx[found]], target_lon[idx[found]]
+    )
+    return idx, length
+
+
+def simplify(
+    lat: np.ndarray, lon: np.ndarray, tolerance: float
+) -> np.ndarray:
+    """
+    Douglas-Peucker, indices of the points to keep so that no dropped point
+    is farther than `tolerance` meters from the simplified line, distances
+    of all points of a span are computed at once
+    """
+    n = len(lat)
+    if n < 3 or tolerance <= 0:
+        return np.arange(n)
+    xy = project(lat, lon, float(np.mean(lat)))
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    spans = [(0, n - 1)]
+    while spans:
+        first, last = spans.pop()
+        if last - first < 2:
+            continue
+        dist = _segment_distance(xy[first + 1:last], xy[first], xy[last])
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            middle = first + 1 + i
+            keep[middle] = True
+            spans.append((first, middle))
+            spans.append((middle, last))
+    return np.flatnonzero(keep)
+
+
+def _segment_distance(
+    points: np.ndarray, a: np.ndarray, b: np.ndarray
+) -> np.ndarray:
+    """
+    distance of (n, 2) points to the segment a-b, not the whole line,
+    so a route doubling back on itself keeps its turning point
+    """
+    ab = b - a
+    length = ab @ ab
+    if length == 0:
+        return np.linalg.norm(points - a, axis=1)
+    t = np.clip((points - a) @ ab / length, 0.0, 1.0)
+    return np.linalg.norm(points - (a + t[:, None] * ab), axis=1)
+
+
+# route segments tested against the candidate points at once
+_CORRIDOR_CHUNK = 64
+
+
+def route_boxes(
+    lat: np.ndarray, lon: np.ndarray, width: float
+) -> np.ndarray:
+    """
+    (n, 4) lat_min, lat_max, lon_min, lon_max of every run of
+    `_CORRIDOR_CHUNK` route segments, grown by `width` meters, together
+    they cover the corridor with far less area than the route's bbox
+    """
+    if len(lat) == 1:
+        lat, lon = np.repeat(lat, 2), np.repeat(lon, 2)
+    d_lat = float(np.degrees(width / EARTH_RADIUS_M))
+    d_lon = d_lat / max(float(np.cos(np.radians(np.abs(lat).max()))), 1e-9)
+    boxes = []
+    for start in range(0, len(lat) - 1, _CORRIDOR_CHUNK):
+        end = start + _CORRIDOR_CHUNK + 1
+        boxes.append([
+            lat[start:end].min() - d_lat,
+            lat[start:end].max() + d_lat,
+            lon[start:end].min() - d_lon,
+            lon[start:end].max() + d_lon,
+        ])
+    return np.array(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def corridor(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    route_lat: np.ndarray,
+    route_lon: np.ndarray,
+    width: float,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    indices of the points within `width` meters of the route ordered by
+    the position of their nearest point on the route, with that position
+    (meters along the route) and their distance to it, every run of
+    segments is tested against the points inside its box at once
+    """
+    if len(route_lat) == 1:
+        route_lat = np.repeat(route_lat, 2)
+        route_lon = np.repeat(route_lon, 2)
+    lat_origin = float(np.mean(route_lat))
+    xy = project(lat, lon, lat_origin)
+    route = project(route_lat, route_lon, lat_origin)
+    a, ab = route[:-1], np.diff(route, axis=0)
+    seg_len2 = (ab * ab).sum(axis=1)
+    seg_len = np.sqrt(seg_len2)
+    start_along = np.concatenate([[0.0], np.cumsum(seg_len)[:-1]])
+
+    dist = np.full(len(xy), np.inf)
+    along = np.zeros(len(xy))
+    for start in range(0, len(a), _CORRIDOR_CHUNK):
+        chunk = slice(start, start + _CORRIDOR_CHUNK)
+        ends = np.concatenate([a[chunk], a[chunk] + ab[chunk]])
+        inside = np.all(
+            (xy >= ends.min(axis=0) - width) & (xy <= ends.max(axis=0) + width),
+            axis=1,
+        )
+        candidates = np.flatnonzero(inside)
+        if not len(candidates):
+            continue
+        # (points, segments) position of the nearest point on every segment
+        ap = xy[candidates, None, :] - a[None, chunk]
+        t = np.divide(
+            (ap * ab[None, chunk]).sum(axis=2),
+            seg_len2[chunk],
+            out=np.zeros((len(candidates), len(seg_len2[chunk]))),
+            where=seg_len2[chunk] > 0,
+        ).clip(0.0, 1.0)
+        d = np.linalg.norm(ap - t[:, :, None] * ab[None, chunk], axis=2)
+        nearest = d.argmin(axis=1)
+        rows = np.arange(len(candidates))
+        d_min = d[rows, nearest]
+        closer = d_min < dist[candidates]
+        i, j = candidates[closer], nearest[closer]
+        dist[i] = d_min[closer]
+        along[i] = start_along[start + j] + \
+            t[rows[closer], j] * seg_len[start + j]
+
+    found = np.flatnonzero(dist <= width)
+    order = np.lexsort((found, along[found]))
+    found = found[order]
+    return found, along[found], dist[found]
+
+
+def encode_polyline(
+    lat: np.ndarray, lon: np.ndarray, precision: int = 5
+) -> str:
+    """
+    Google encoded polyline, every coordinate is rounded to `precision`
+    decimals and stored as the zigzag-encoded difference to the previous one
+    in 5-bit chunks, least significant first
+    """
+    if not len(lat):
+        return ''
+    coords = np.round(np.column_stack([lat, lon]) * 10 ** precision)
+    deltas = np.diff(coords.astype(np.int64), axis=0, prepend=0).ravel()
+    values = (deltas << 1) ^ (deltas >> 63)
+
+    shifts = np.arange(0, 64, 5, dtype=np.int64)
+    chunks = (values[:, None] >> shifts) & 0x1f
+    n_chunks = 1 + ((values[:, None] >> shifts[1:]) > 0).sum(axis=1)
+    position = np.arange(len(shifts))
+    used = position < n_chunks[:, None]
+    # 0x20 marks that another chunk of the same value follows
+    chunks |= np.where(position < n_chunks[:, None] - 1, 0x20, 0)
+    return (chunks[used] + 63).astype(np.uint8).tobytes().decode('ascii')
+
+
+def convex_hull(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    indices of the points on the convex hull in counter-clockwise order,
+    all points if there are too few or they lie on a line
+    """
+    from scipy.spatial import ConvexHull
+    from scipy.spatial import QhullError
+    if len(lat) < 3:
+        return np.arange(len(lat))
+    try:
+        return ConvexHull(project(lat, lon, float(np.mean(lat)))).vertices
+    except QhullError:
+        return np.arange(len(lat))
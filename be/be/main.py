@@ -1,8 +1,20 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 from fastapi import FastAPI
 from fastapi.openapi import utils as openapi_utils
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from be.config import settings
+from be.metrics import MetricsMiddleware
+from be.metrics import render_metrics
+from be.neo import create_async_driver
+from be.poi_index import get_poi_index
+from be.routing.ch import get_contraction_hierarchy
+from be.routing.graph import get_road_graph
+from be.routing.matrix import shutdown_matrix_executor
+from be.snapshot import get_snapshot
 from be.exc.api import APIError
 from be.schemas.http import ResponseBody
 from be.schemas.http import ErrorResponseBody
@@ -16,7 +28,26 @@ openapi_utils.validation_error_response_definition = {
     "$ref": openapi_utils.REF_PREFIX + APIError.model.__name__,  # type: ignore [attr-defined]
 }
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    app.state.async_driver = create_async_driver()
+    # load in-memory data before the first request needs it
+    if settings.USE_SNAPSHOT:
+        await run_in_threadpool(get_snapshot)
+    if settings.ROUTING_ENGINE == 'csr':
+        await run_in_threadpool(get_road_graph)
+    if settings.ROUTING_ENGINE == 'ch':
+        await run_in_threadpool(get_contraction_hierarchy)
+    if settings.POI_ENGINE == 'memory':
+        await run_in_threadpool(get_poi_index)
+    yield
+    shutdown_matrix_executor()
+    await app.state.async_driver.close()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     openapi_url=\
         f'{settings.API_V1_PREFIX}/openapi.json' \
         if settings.API_ALLOW_DOCS else None,
@@ -35,14 +66,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get('/metrics', include_in_schema=False)
+    async def metrics() -> PlainTextResponse:
+        return PlainTextResponse(
+            render_metrics(),
+            media_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
 @app.get('/')
-def root() -> ResponseBody[None]:
+async def root() -> ResponseBody[None]:
     return ResponseBody(message='running')
 
 @app.get('/err')
-def err() -> ErrorResponseBody:
+async def err() -> ErrorResponseBody:
     raise APIError()
 
 app.include_router(
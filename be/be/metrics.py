@@ -0,0 +1,193 @@
+"""
+request and Cypher query metrics, kept per process and rendered
+in the Prometheus text format by `GET /metrics`
+"""
+from bisect import bisect_left
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import Any
+from neo4j import ResultSummary
+from starlette.types import ASGIApp
+from starlette.types import Message
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
+
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 30.0, 60.0
+)
+SIZE_BUCKETS = (
+    100.0, 1_000.0, 10_000.0, 100_000.0, 1_000_000.0, 10_000_000.0,
+    100_000_000.0
+)
+ROW_BUCKETS = (
+    0.0, 1.0, 10.0, 100.0, 1_000.0, 10_000.0, 100_000.0, 1_000_000.0
+)
+
+
+class Histogram:
+    """
+    cumulative histogram with a fixed set of labels, thread-safe
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...],
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> (counts per bucket, +Inf last), sum
+        self._series: dict[tuple[str, ...], tuple[list[int], float]] = {}
+        self._lock = Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts, total = self._series.get(
+                key, ([0] * (len(self.buckets) + 1), 0.0)
+            )
+            counts[bisect_left(self.buckets, value)] += 1
+            self._series[key] = (counts, total + value)
+
+    def render(self) -> list[str]:
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            series = {k: (list(c), s) for k, (c, s) in self._series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            labels = [
+                f'{name}="{_escape(value)}"'
+                for name, value in zip(self.labelnames, key)
+            ]
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = ','.join(labels + [f'le="{bound}"'])
+                lines.append(f'{self.name}_bucket{{{le}}} {cumulative}')
+            cumulative += counts[-1]
+            le = ','.join(labels + ['le="+Inf"'])
+            lines.append(f'{self.name}_bucket{{{le}}} {cumulative}')
+            joined = ','.join(labels)
+            lines.append(f'{self.name}_sum{{{joined}}} {total}')
+            lines.append(f'{self.name}_count{{{joined}}} {cumulative}')
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+_registry: list[Histogram] = []
+
+http_request_duration = Histogram(
+    'http_request_duration_seconds',
+    'time from receiving a request until its response body is sent',
+    ('method', 'route', 'status'),
+)
+http_response_size = Histogram(
+    'http_response_size_bytes',
+    'size of the response body',
+    ('method', 'route'),
+    buckets=SIZE_BUCKETS,
+)
+neo_query_available = Histogram(
+    'neo_query_result_available_seconds',
+    'server-side time until the first record of a query was available',
+    ('query',),
+)
+neo_query_consumed = Histogram(
+    'neo_query_result_consumed_seconds',
+    'server-side time until all records of a query were consumed',
+    ('query',),
+)
+neo_query_rows = Histogram(
+    'neo_query_rows',
+    'number of records returned by a query',
+    ('query',),
+    buckets=ROW_BUCKETS,
+)
+neo_query_deserialize = Histogram(
+    'neo_query_deserialize_seconds',
+    'client-side time spent fetching and converting the records of a query',
+    ('query',),
+)
+
+
+def observe_query(
+    name: str, summary: ResultSummary, rows: int, deserialize: float
+) -> None:
+    if summary.result_available_after is not None:
+        neo_query_available.observe(
+            summary.result_available_after / 1000, query=name
+        )
+    if summary.result_consumed_after is not None:
+        neo_query_consumed.observe(
+            summary.result_consumed_after / 1000, query=name
+        )
+    neo_query_rows.observe(rows, query=name)
+    neo_query_deserialize.observe(deserialize, query=name)
+
+
+def render_metrics() -> str:
+    return '\n'.join(line for h in _registry for line in h.render()) + '\n'
+
+
+def write_metrics(path: Path | str) -> None:
+    """
+    dump the metrics of a cli run, e.g. for the node_exporter
+    textfile collector
+    """
+    Path(path).write_text(render_metrics(), encoding='utf-8')
+
+
+class MetricsMiddleware:
+    """
+    records latency and response size of every http request,
+    labelled by the route template so path parameters don't add series
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, size
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                size += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            path = getattr(route, 'path', None) or 'unmatched'
+            http_request_duration.observe(
+                perf_counter() - start,
+                method=scope['method'],
+                route=path,
+                status=status,
+            )
+            http_response_size.observe(
+                size, method=scope['method'], route=path
+            )
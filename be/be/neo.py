@@ -1,10 +1,33 @@
 from neo4j import GraphDatabase
+from neo4j import AsyncGraphDatabase
+from neo4j import AsyncDriver
+from neo4j import AsyncManagedTransaction
+from neo4j import AsyncSession
 from neo4j import ManagedTransaction
-from neo4j import Result as TxResult
-from typing import Sequence
+from neo4j import Session
+from typing import AsyncIterator
+from typing import Iterable
+from typing import Callable
 from typing import Any
+from typing import Literal
+from bisect import bisect_right
+from dataclasses import dataclass
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from queue import Empty
+from queue import Full
+from threading import Event
+from time import perf_counter
+import numpy as np
 from be.config import settings
-from be.utils import get_osm_csv_records
+from be.geo import snap_to_nearest
+from be.metrics import observe_query
+from be.routing.weights import with_travel_time
+from be.utils import iter_dataset
+from be.utils import iter_batches
+from be.utils import prefetch
+from be.utils import with_content_hash
 
 
 driver = GraphDatabase.driver(
@@ -14,27 +37,269 @@ driver = GraphDatabase.driver(
 )
 
 
+def create_async_driver() -> AsyncDriver:
+    return AsyncGraphDatabase.driver(
+        uri=settings.NEO_URI,
+        database=settings.NEO_DATABASE,
+        auth=(settings.NEO_USERNAME, settings.NEO_PASSWORD),
+        max_connection_pool_size=settings.NEO_MAX_CONNECTION_POOL_SIZE
+    )
+
+
+def neo_query(
+    tx: ManagedTransaction | Session,
+    name: str,
+    query: str,
+    params: dict[str, Any] = {},
+    fetch: Literal['data', 'values'] = 'data'
+) -> list[Any]:
+    """
+    run a query and fetch all records, recording server-side timings,
+    row count and client-side fetch time under `name`
+    """
+    result = tx.run(query=query, parameters=params)
+    start = perf_counter()
+    records = getattr(result, fetch)()
+    deserialize = perf_counter() - start
+    observe_query(name, result.consume(), len(records), deserialize)
+    return records
+
+
+async def neo_query_async(
+    tx: AsyncManagedTransaction | AsyncSession,
+    name: str,
+    query: str,
+    params: dict[str, Any] = {}
+) -> list[dict[str, Any]]:
+    result = await tx.run(query=query, parameters=params)
+    start = perf_counter()
+    records = await result.data()
+    deserialize = perf_counter() - start
+    observe_query(name, await result.consume(), len(records), deserialize)
+    return records
+
+
+async def neo_stream_async(
+    tx: AsyncManagedTransaction | AsyncSession,
+    name: str,
+    query: str,
+    params: dict[str, Any] = {}
+) -> AsyncIterator[dict[str, Any]]:
+    """
+    yield records as the driver receives them instead of fetching
+    the whole result first, metrics are recorded once it is exhausted
+    """
+    result = await tx.run(query=query, parameters=params)
+    rows = 0
+    deserialize = 0.0
+    while True:
+        start = perf_counter()
+        record = await result.fetch(1)
+        deserialize += perf_counter() - start
+        if not record:
+            break
+        rows += 1
+        yield record[0].data()
+    observe_query(name, await result.consume(), rows, deserialize)
+
+
 def neo_batch_insert(
     tx: ManagedTransaction,
     query: str,
-    data: Sequence[dict[str, Any]],
-    batch_size: int = 10000
- ) -> None:
+    data: Iterable[dict[str, Any]],
+    batch_size: int = 10000,
+    name: str = 'insert'
+ ) -> int:
     assert '$data' in query, 'query missing "$data"'
-    total, batch = 0, 0
-    while batch * batch_size < len(data):
-        results = tx.run(
-            query=query,
-            parameters={'data': data[batch*batch_size:(batch+1)*batch_size]}
-        ).data()
+    total = 0
+    for batch in iter_batches(data, batch_size):
+        results = neo_query(tx, name, query=query, params={'data': batch})
         total += results[0]['total']
-        batch += 1
+    return total
+
+
+def neo_stream_insert(
+    session: Session,
+    query: str,
+    data: Iterable[dict[str, Any]],
+    batch_size: int = 10000,
+    name: str = 'insert'
+) -> int:
+    """
+    write `data` lazily, one transaction per batch,
+    the next batch is parsed while the current one is being written
+    """
+    total = 0
+    for batch in prefetch(iter_batches(data, batch_size)):
+        total += session.execute_write(
+            neo_batch_insert,
+            query=query,
+            data=batch,
+            batch_size=batch_size,
+            name=name
+        )
+    return total
+
+
+def neo_parallel_insert(
+    query: str,
+    data: Iterable[dict[str, Any]],
+    workers: int,
+    partition: Callable[[dict[str, Any]], int] | None = None,
+    batch_size: int = 10000,
+    name: str = 'insert'
+) -> int:
+    """
+    write `data` through `workers` sessions in parallel, every row is routed
+    to the worker `partition(row)` (batches are dealt round-robin if None),
+    so workers write disjoint parts of the graph, transient errors
+    (deadlocks, lock timeouts) are retried by `execute_write`
+    """
+    queues: list[Queue[list[dict[str, Any]] | None]] = \
+        [Queue(maxsize=2) for _ in range(workers)]
+    # set on any error, workers waiting for a batch that never comes stop
+    stop = Event()
+
+    def write(queue: Queue[list[dict[str, Any]] | None]) -> tuple[int, float]:
+        total, busy = 0, 0.0
+        with driver.session() as session:
+            while not stop.is_set():
+                try:
+                    batch = queue.get(timeout=0.1)
+                except Empty:
+                    continue
+                if batch is None:
+                    break
+                start = perf_counter()
+                total += session.execute_write(
+                    neo_batch_insert,
+                    query=query,
+                    data=batch,
+                    batch_size=batch_size,
+                    name=name
+                )
+                busy += perf_counter() - start
+        return total, busy
+
+    def put(worker: int, batch: list[dict[str, Any]] | None) -> None:
+        while True:
+            try:
+                queues[worker].put(batch, timeout=0.1)
+                return
+            except Full:
+                # surface the error of a failed worker instead of blocking
+                if futures[worker].done():
+                    futures[worker].result()
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures: list[Future[tuple[int, float]]] = \
+            [executor.submit(write, q) for q in queues]
+        buffers: list[list[dict[str, Any]]] = [[] for _ in range(workers)]
+        try:
+            for i, row in enumerate(data):
+                worker = partition(row) if partition \
+                    else (i // batch_size) % workers
+                buffers[worker].append(row)
+                if len(buffers[worker]) >= batch_size:
+                    put(worker, buffers[worker])
+                    buffers[worker] = []
+            for worker, buffer in enumerate(buffers):
+                if buffer:
+                    put(worker, buffer)
+                put(worker, None)
+            results = [f.result() for f in futures]
+        except BaseException:
+            # the executor waits for every worker before the error propagates
+            stop.set()
+            raise
+    elapsed = perf_counter() - start
+
+    total = sum(r[0] for r in results)
+    busy = sum(r[1] for r in results)
+    # how many workers were writing on average, not measured against a
+    # serial load
+    print(
+        f'Wrote {total} rows with {workers} workers in {elapsed:.1f}s '
+        f'({total / max(elapsed, 1e-9):.0f} rows/s), '
+        f'parallelism (write time / wall time) '
+        f'{busy / max(elapsed, 1e-9):.1f}x'
+    )
+    return total
+
+
+def neo_insert(
+    query: str,
+    data: Iterable[dict[str, Any]],
+    workers: int = 1,
+    partition: Callable[[dict[str, Any]], int] | None = None,
+    name: str = 'insert'
+) -> int:
+    if workers > 1:
+        return neo_parallel_insert(
+            query=query,
+            data=data,
+            workers=workers,
+            partition=partition,
+            name=name
+        )
+    with driver.session() as session:
+        return neo_stream_insert(session, query=query, data=data, name=name)
+
+
+@dataclass
+class Diff:
+    # new rows and rows whose content hash changed
+    changed: list[dict[str, Any]]
+    # stored records of the changed rows that already existed
+    previous: list[dict[str, Any]]
+    # stored records missing from the new data
+    removed: list[dict[str, Any]]
+
+
+def neo_diff(
+    name: str,
+    data: Iterable[dict[str, Any]],
+    key: Callable[[dict[str, Any]], Any],
+    stored_query: str,
+) -> Diff:
+    """
+    compare `data` (rows with a `content_hash`) against the records
+    returned by `stored_query`, which has to return their `key`
+    and `content_hash`, list keys are compared as tuples
+    """
+    with driver.session() as session:
+        stored = {
+            tuple(r['key']) if isinstance(r['key'], list) else r['key']: r
+            for r in neo_query(session, f'{name}_hashes', query=stored_query)
+        }
+    diff = Diff(changed=[], previous=[], removed=[])
+    unchanged = 0
+    for row in data:
+        record = stored.pop(key(row), None)
+        if record is not None and \
+                record['content_hash'] == row['content_hash']:
+            unchanged += 1
+            continue
+        diff.changed.append(row)
+        if record is not None:
+            diff.previous.append(record)
+    diff.removed = list(stored.values())
+    print(
+        f'{name}: {len(diff.changed) - len(diff.previous)} new, '
+        f'{len(diff.previous)} changed, {len(diff.removed)} removed, '
+        f'{unchanged} unchanged'
+    )
+    return diff
 
 
 def neo_run(
-    tx: ManagedTransaction, query: str, params: dict[str, Any] = {}
-) -> TxResult:
-    return tx.run(query=query, parameters=params)
+    tx: ManagedTransaction,
+    query: str,
+    params: dict[str, Any] = {},
+    name: str = 'run'
+) -> list[dict[str, Any]]:
+    return neo_query(tx, name, query=query, params=params)
 
 
 def neo_clean_db() -> None:
@@ -46,7 +311,24 @@ def neo_clean_db() -> None:
         )
     '''
     with driver.session() as session:
-        session.execute_write(neo_run, query=query)
+        session.execute_write(neo_run, query=query, name='clean_db')
+
+
+def bump_dataset_version(name: str) -> None:
+    """
+    mark a dataset as reloaded, lets the api drop caches built from it
+    """
+    query = '''
+        MERGE (v:DatasetVersion {name: $name})
+        SET v.version = timestamp()
+    '''
+    with driver.session() as session:
+        session.execute_write(
+            neo_run,
+            query=query,
+            params={'name': name},
+            name='bump_dataset_version'
+        )
 
 
 def create_prague_road_indexes() -> None:
@@ -63,64 +345,178 @@ def create_prague_road_indexes() -> None:
     intersection_point_index_query = '''
         CREATE POINT INDEX IF NOT EXISTS FOR (i:Intersection) ON i.location
     '''
+    address_point_index_query = '''
+        CREATE POINT INDEX IF NOT EXISTS FOR (a:Address) ON a.location
+    '''
     with driver.session() as session:
-        session.execute_write(neo_run, query=intersection_constraint_query)
-        session.execute_write(neo_run, query=road_segment_index_query)
-        session.execute_write(neo_run, query=address_constraint_query)
-        session.execute_write(neo_run, query=intersection_point_index_query)
+        for query in (
+            intersection_constraint_query,
+            road_segment_index_query,
+            address_constraint_query,
+            intersection_point_index_query,
+            address_point_index_query,
+        ):
+            session.execute_write(
+                neo_run, query=query, name='create_road_indexes'
+            )
 
 
-def load_prague_road_nodes() -> None:
-    data = get_osm_csv_records(
-        path=settings.DATA_DIR.joinpath(settings.DS_ROAD_PRG_NODES_FILENAME)
-    )
+def load_prague_road_nodes(
+    workers: int = 1, incremental: bool = False
+) -> None:
+    data = with_content_hash(iter_dataset('road_nodes'))
     query = '''
         UNWIND $data AS row
         WITH row WHERE row.osmid IS NOT NULL
-        MERGE (i:Intersection {osmid: toInteger(row.osmid)})
-            SET i.location = 
-            point({latitude: toFLoat(row.y), longitude: toFloat(row.x) }),
+        MERGE (i:Intersection {osmid: row.osmid})
+            SET i.location = point({latitude: row.y, longitude: row.x}),
                 i.ref = row.ref,
                 i.highway = row.highway,
-                i.street_count = toInteger(row.street_count)
+                i.street_count = row.street_count,
+                i.content_hash = row.content_hash
         RETURN COUNT(*) as total
     '''
-    with driver.session() as session:
-        session.execute_write(neo_batch_insert, query=query, data=data)
-
+    if not incremental:
+        neo_insert(
+            query=query, data=data, workers=workers, name='load_road_nodes'
+        )
+        return
 
-def load_prague_road_rels() -> None:
-    data = get_osm_csv_records(
-        path=settings.DATA_DIR.joinpath(settings.DS_ROAD_PRG_RELS_FILENAME)
+    diff = neo_diff(
+        'road_nodes',
+        data=(row for row in data if row['osmid'] is not None),
+        key=lambda row: row['osmid'],
+        stored_query='''
+            MATCH (i:Intersection)
+            RETURN
+                i.osmid AS key,
+                i.content_hash AS content_hash,
+                i.location.latitude AS lat,
+                i.location.longitude AS lon
+        '''
+    )
+    delete_query = '''
+        UNWIND $data AS row
+        MATCH (i:Intersection {osmid: row.key})
+        DETACH DELETE i
+        RETURN COUNT(*) AS total
+    '''
+    # addresses near an old or a new intersection position are snapped again
+    _unsnap_prague_addresses(diff.previous + diff.removed)
+    neo_insert(query=delete_query, data=diff.removed, name='delete_road_nodes')
+    neo_insert(
+        query=query, data=diff.changed, workers=workers, name='load_road_nodes'
     )
+    _unsnap_prague_addresses(
+        {'lat': row['y'], 'lon': row['x']} for row in diff.changed
+    )
+
+
+def load_prague_road_rels(
+    workers: int = 1, incremental: bool = False
+) -> None:
+    data = with_content_hash(with_travel_time(iter_dataset('road_rels')))
     query = '''
         UNWIND $data AS road
-        WITH road WHERE road.osmid IS NOT NULL
-        MATCH (u:Intersection {osmid: toInteger(road.u)})
-        MATCH (v:Intersection {osmid: toInteger(road.v)})
-        MERGE (u)-[r:ROAD_SEGMENT {osmid: COALESCE(toInteger(road.osmid), -1)}]->(v)
+        MATCH (u:Intersection {osmid: road.u})
+        MATCH (v:Intersection {osmid: road.v})
+        MERGE (u)-[r:ROAD_SEGMENT {osmid: COALESCE(road.osmid, -1)}]->(v)
             SET r.oneway = road.oneway,
                 r.lanes = road.lanes,
                 r.ref = road.ref,
                 r.name = road.name,
                 r.highway = road.highway,
                 r.max_speed = road.maxspeed,
-                r.length = toFloat(road.length)
+                r.speed = road.speed,
+                r.length = road.length,
+                r.travel_time = road.travel_time,
+                r.content_hash = road.content_hash
         RETURN COUNT(*) AS total
     '''
-    with driver.session() as session:
-        session.execute_write(neo_batch_insert, query=query, data=data)
+    if incremental:
+        diff = neo_diff(
+            'road_rels',
+            data=data,
+            key=_road_segment_key,
+            stored_query='''
+                MATCH (u:Intersection)-[r:ROAD_SEGMENT]->(v:Intersection)
+                RETURN
+                    [u.osmid, v.osmid, r.osmid] AS key,
+                    r.content_hash AS content_hash
+            '''
+        )
+        delete_query = '''
+            UNWIND $data AS row
+            MATCH (:Intersection {osmid: row.key[0]})
+                -[r:ROAD_SEGMENT {osmid: row.key[2]}]->
+                (:Intersection {osmid: row.key[1]})
+            DELETE r
+            RETURN COUNT(*) AS total
+        '''
+        neo_insert(
+            query=delete_query, data=diff.removed, name='delete_road_rels'
+        )
+        data = diff.changed
+    neo_insert(
+        query=query,
+        data=data,
+        workers=workers,
+        partition=_road_source_partition(workers) if workers > 1 else None,
+        name='load_road_rels'
+    )
+
+
+def _road_segment_key(row: dict[str, Any]) -> tuple[int, int, int]:
+    """
+    (u, v, osmid) as MERGEd by `load_prague_road_rels`,
+    merged ways have no single osmid, stored as -1
+    """
+    osmid = row['osmid']
+    return row['u'], row['v'], -1 if osmid is None else osmid
+
+
+def _unsnap_prague_addresses(
+    points: Iterable[dict[str, Any]], max_distance: float = 200
+) -> None:
+    """
+    drop NEAREST_INTERSECTION of addresses within `max_distance`
+    of `points`, the next snap assigns them again
+    """
+    query = f'''
+        UNWIND $data AS row
+        MATCH (a:Address)
+        WHERE point.distance(
+            a.location, point({{latitude: row.lat, longitude: row.lon}})
+        ) < {float(max_distance)}
+        MATCH (a)-[r:NEAREST_INTERSECTION]->(:Intersection)
+        WITH DISTINCT r
+        DELETE r
+        RETURN COUNT(*) AS total
+    '''
+    neo_insert(query=query, data=points, name='unsnap_addresses')
 
 
-def load_prague_address_nodes() -> None:
-    data = get_osm_csv_records(
-        path=settings.DATA_DIR.joinpath(settings.DS_ADDRESS_PRG_NODES_FILENAME)
+def _road_source_partition(workers: int) -> Callable[[dict[str, Any]], int]:
+    """
+    split road segments into `workers` ranges of equal size by the osmid
+    of their source intersection, segments leaving the same intersection
+    always end up in the same worker
+    """
+    osmids = sorted(
+        row['osmid'] for row in iter_dataset('road_nodes')
+        if row['osmid'] is not None
     )
+    bounds = [osmids[len(osmids) * k // workers] for k in range(1, workers)]
+    return lambda row: bisect_right(bounds, row['u'])
+
+
+def load_prague_address_nodes(incremental: bool = False) -> None:
+    data = with_content_hash(iter_dataset('address'))
     query = '''
         UNWIND $data AS row
-        MERGE (a:Address {id: toInteger(row.id)})
+        MERGE (a:Address {id: row.id})
         SET
-            a.location = point({ latitude: toFloat(row.lat), longitude: toFloat(row.lon) }),
+            a.location = point({latitude: row.lat, longitude: row.lon}),
             a.full_address =
                 + row.tags.addr_street
                 + " "
@@ -131,10 +527,34 @@ def load_prague_address_nodes() -> None:
                 + row.tags.addr_postcode
                 + ", Czech Republic"
         SET a += row.tags
+        SET a.content_hash = row.content_hash
         RETURN COUNT(*) AS total
     '''
-    with driver.session() as session:
-        session.execute_write(neo_batch_insert, query=query, data=data)
+    if incremental:
+        diff = neo_diff(
+            'address',
+            data=data,
+            key=lambda row: row['id'],
+            stored_query='''
+                MATCH (a:Address)
+                RETURN a.id AS key, a.content_hash AS content_hash
+            '''
+        )
+        # changed addresses are recreated so removed tags don't linger,
+        # the next snap links them to their nearest intersection again
+        delete_query = '''
+            UNWIND $data AS row
+            MATCH (a:Address {id: row.key})
+            DETACH DELETE a
+            RETURN COUNT(*) AS total
+        '''
+        neo_insert(
+            query=delete_query,
+            data=diff.previous + diff.removed,
+            name='delete_address_nodes'
+        )
+        data = diff.changed
+    neo_insert(query=query, data=data, name='load_address_nodes')
 
 
 def create_prague_address_road_rels() -> None:
@@ -161,7 +581,68 @@ def create_prague_address_road_rels() -> None:
     )
     '''
     with driver.session() as session:
-        session.execute_write(neo_run, query=query)
+        session.execute_write(
+            neo_run, query=query, name='create_address_road_rels'
+        )
+
+
+def create_prague_address_road_rels_kdtree(max_distance: float = 200) -> None:
+    """
+    same as `create_prague_address_road_rels`, but the nearest intersection
+    of every address is found client-side in a single KD-tree query
+    """
+    intersections_query = '''
+        MATCH (i:Intersection)
+        RETURN
+            i.osmid AS osmid,
+            i.location.latitude AS lat,
+            i.location.longitude AS lon
+    '''
+    addresses_query = '''
+        MATCH (a:Address)
+        WHERE NOT EXISTS ((a)-[:NEAREST_INTERSECTION]->(:Intersection))
+        RETURN
+            a.id AS id,
+            a.location.latitude AS lat,
+            a.location.longitude AS lon
+    '''
+    with driver.session() as session:
+        intersections = neo_query(
+            session,
+            'snap_intersections',
+            query=intersections_query,
+            fetch='values'
+        )
+        addresses = neo_query(
+            session,
+            'snap_addresses',
+            query=addresses_query,
+            fetch='values'
+        )
+    if not intersections or not addresses:
+        return
+
+    i_osmid, i_lat, i_lon = (np.array(col) for col in zip(*intersections))
+    a_id, a_lat, a_lon = (np.array(col) for col in zip(*addresses))
+    idx, length = snap_to_nearest(a_lat, a_lon, i_lat, i_lon, max_distance)
+    found = idx >= 0
+    a_id, idx, length = a_id[found], idx[found], length[found]
+
+    data = (
+        {'id': id_, 'osmid': osmid, 'length': d}
+        for id_, osmid, d in zip(
+            a_id.tolist(), i_osmid[idx].tolist(), length.tolist()
+        )
+    )
+    query = '''
+        UNWIND $data AS row
+        MATCH (a:Address {id: row.id})
+        MATCH (i:Intersection {osmid: row.osmid})
+        MERGE (a)-[r:NEAREST_INTERSECTION]->(i)
+        SET r.length = row.length
+        RETURN COUNT(*) AS total
+    '''
+    neo_insert(query=query, data=data, name='create_address_road_rels')
 
 
 def create_prague_poi_address_fulltext_index() -> None:
@@ -170,25 +651,137 @@ def create_prague_poi_address_fulltext_index() -> None:
         FOR (p:PointOfInterest|Address) ON EACH [p.name, p.full_address]
     '''
     with driver.session() as session:
-        session.execute_write(neo_run, query=query)
+        session.execute_write(neo_run, query=query, name='create_search_index')
 
-def load_prague_poi() -> None:
-    data = get_osm_csv_records(
-        path=settings.DATA_DIR.joinpath(settings.DS_POI_PRG_NODES_FILENAME)
-    )
+def load_prague_poi(workers: int = 1, incremental: bool = False) -> None:
+    data = with_content_hash(iter_dataset('poi'))
+    if settings.POI_SCHEMA == 'compact' or incremental:
+        create_prague_poi_indexes()
+    if settings.POI_SCHEMA == 'compact':
+        query = '''
+            UNWIND $data AS row
+            CREATE (p:PointOfInterest {
+                id: row.id, name: row.name, content_hash: row.content_hash
+            })
+            SET p.location = point({latitude: row.lat, longitude: row.lon}),
+                p.tags = apoc.convert.toJson(row.tags)
+            WITH *
+            CALL apoc.create.addLabels(p, [row.class, row.subclass]) YIELD node
+            RETURN COUNT(*) AS total
+        '''
+    else:
+        query = '''
+            UNWIND $data AS row
+            CREATE (p:PointOfInterest {
+                id: row.id, name: row.name, content_hash: row.content_hash
+            })
+            CREATE (g:Geometry)
+            SET g.location = point({latitude: row.lat, longitude: row.lon})
+            CREATE (g)<-[:HAS_GEOMETRY]-(p)
+            SET g:Point
+            CREATE (t:Tags)
+            SET t += row.tags
+            CREATE (p)-[:HAS_TAGS]->(t)
+            WITH *
+            CALL apoc.create.addLabels(p, [row.class, row.subclass]) YIELD node
+            RETURN COUNT(*) AS total
+        '''
+    if incremental:
+        diff = neo_diff(
+            'poi',
+            data=data,
+            key=lambda row: row['id'],
+            stored_query='''
+                MATCH (p:PointOfInterest)
+                RETURN p.id AS key, p.content_hash AS content_hash
+            '''
+        )
+        # POIs are CREATEd, changed ones are deleted with their
+        # Geometry and Tags nodes first
+        delete_query = '''
+            UNWIND $data AS row
+            MATCH (p:PointOfInterest {id: row.key})
+            OPTIONAL MATCH (p)-[:HAS_GEOMETRY|HAS_TAGS]->(n)
+            WITH p, collect(n) AS parts
+            DETACH DELETE p
+            FOREACH (n IN parts | DETACH DELETE n)
+            RETURN COUNT(*) AS total
+        '''
+        neo_insert(
+            query=delete_query,
+            data=diff.previous + diff.removed,
+            name='delete_poi'
+        )
+        data = diff.changed
+    neo_insert(query=query, data=data, workers=workers, name='load_poi')
+    # point indexes of the graph layout's Point nodes, or of the
+    # categories that were just loaded (compact layout)
+    create_prague_poi_indexes()
+
+
+def create_prague_poi_indexes(categories: bool | None = None) -> None:
+    """
+    `categories` (default: the compact layout) adds a point index per class
+    and subclass label present at the time, so k-nearest searches by
+    category only scan that category, the graph layout keeps locations
+    on Point nodes, their index serves its radius and bbox filters
+    """
+    if categories is None:
+        categories = settings.POI_SCHEMA == 'compact'
+    point_index_query = '''
+        CREATE POINT INDEX IF NOT EXISTS FOR (p:PointOfInterest) ON p.location
+    '''
+    geometry_index_query = '''
+        CREATE POINT INDEX IF NOT EXISTS FOR (p:Point) ON p.location
+    '''
+    id_index_query = '''
+        CREATE INDEX IF NOT EXISTS FOR (p:PointOfInterest) ON (p.id)
+    '''
+    labels_query = '''
+        MATCH (p:PointOfInterest)
+        UNWIND labels(p) AS label
+        RETURN DISTINCT label
+    '''
+    with driver.session() as session:
+        queries = [point_index_query, geometry_index_query, id_index_query]
+        if categories:
+            labels = neo_query(session, 'poi_labels', query=labels_query)
+            queries.extend(
+                f'''
+                CREATE POINT INDEX IF NOT EXISTS
+                FOR (p:{cypher_label(r['label'])}) ON p.location
+                '''
+                for r in labels if r['label'] != 'PointOfInterest'
+            )
+        for query in queries:
+            session.execute_write(
+                neo_run, query=query, name='create_poi_indexes'
+            )
+
+
+def cypher_label(label: str) -> str:
+    """
+    labels can't be query parameters, quote them to be used in query text
+    """
+    return '`' + label.replace('`', '``') + '`'
+
+
+def migrate_prague_poi_compact() -> None:
+    """
+    move location and tags of every POI from its Geometry and Tags nodes
+    onto the PointOfInterest node (`POI_SCHEMA=compact` layout)
+    """
+    create_prague_poi_indexes()
     query = '''
-        UNWIND $data AS row
-        CREATE (p:PointOfInterest {id: row.id, name: row.name})
-        CREATE (g:Geometry)
-        SET g.location = point({latitude: toFloat(row.lat), longitude: toFloat(row.lon) })
-        CREATE (g)<-[:HAS_GEOMETRY]-(p)
-        SET g:Point
-        CREATE (t:Tags)
-        SET t += row.tags
-        CREATE (p)-[:HAS_TAGS]->(t)
-        WITH *
-        CALL apoc.create.addLabels(p, [row.class, row.subclass]) YIELD node
-        RETURN COUNT(*) AS total
+        CALL apoc.periodic.iterate(
+        'MATCH (p:PointOfInterest)-[:HAS_GEOMETRY]->(g:Point) RETURN p, g',
+        'OPTIONAL MATCH (p)-[:HAS_TAGS]->(t:Tags)
+        SET p.location = g.location,
+            p.tags = apoc.convert.toJson(coalesce(properties(t), {}))
+        DETACH DELETE g, t',
+        {batchSize:1000, parallel:false}
+    )
     '''
     with driver.session() as session:
-        session.execute_write(neo_batch_insert, query=query, data=data)
\ No newline at end of file
+        session.execute_write(neo_run, query=query, name='migrate_poi')
+    create_prague_poi_indexes(categories=True)
@@ -0,0 +1,322 @@
+"""
+node and relationship files for `neo4j-admin database import`,
+the graph is the same as the one built by the `load_prague_*` loaders
+in `be.neo`, including `NEAREST_INTERSECTION` relationships
+
+OSM tag keys (`addr:street`, `name:en`, ...) can't be header columns,
+neo4j-admin reads what follows a ':' as the type, so tags are written as
+one json column and expanded into properties by `expand_imported_tags`
+"""
+from csv import writer
+from dataclasses import dataclass
+from dataclasses import field
+from json import dumps
+from pathlib import Path
+from typing import Any
+from typing import Iterable
+import numpy as np
+from be.config import settings
+from be.geo import snap_to_nearest
+from be.routing.weights import with_travel_time
+from be.utils import iter_dataset
+from be.utils import with_content_hash
+
+
+_POINT = 'location:point{crs:WGS-84}'
+_TAGS = 'tags_json'
+
+# properties written by the import itself, tags never overwrite them
+_ADDRESS_PROPERTIES = ('id', 'location', 'full_address', 'content_hash')
+
+
+@dataclass
+class ImportFiles:
+    nodes: list[Path] = field(default_factory=list)
+    relationships: list[Path] = field(default_factory=list)
+    rows: dict[str, int] = field(default_factory=dict)
+
+    def command(self, database: str) -> list[str]:
+        """
+        the database has to be stopped, its current content is replaced
+        """
+        return [
+            'neo4j-admin', 'database', 'import', 'full',
+            '--overwrite-destination=true',
+            '--multiline-fields=true',
+            '--array-delimiter=;',
+            *(f'--nodes={p}' for p in self.nodes),
+            *(f'--relationships={p}' for p in self.relationships),
+            database,
+        ]
+
+
+def write_import_files(
+    out_dir: Path | str, max_distance: float = 200
+) -> ImportFiles:
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    files = ImportFiles()
+
+    intersections = _write_intersections(out_dir, files)
+    _write_road_segments(out_dir, files, set(intersections))
+    addresses = _write_addresses(out_dir, files)
+    _write_nearest_intersections(
+        out_dir, files, intersections, addresses, max_distance
+    )
+    if settings.POI_SCHEMA == 'compact':
+        _write_poi_compact(out_dir, files)
+    else:
+        _write_poi_graph(out_dir, files)
+    return files
+
+
+def _write(
+    files: ImportFiles,
+    path: Path,
+    header: list[str],
+    rows: Iterable[list[Any]],
+    relationships: bool = False,
+) -> None:
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        w = writer(f)
+        w.writerow(header)
+        for row in rows:
+            w.writerow(row)
+            count += 1
+    (files.relationships if relationships else files.nodes).append(path)
+    files.rows[path.stem] = count
+
+
+def _point(lat: Any, lon: Any) -> str:
+    return f'{{latitude:{float(lat)},longitude:{float(lon)}}}'
+
+
+def _tags(tags: dict[str, Any]) -> str:
+    return dumps(tags, ensure_ascii=False)
+
+
+def _write_intersections(
+    out_dir: Path, files: ImportFiles
+) -> dict[int, tuple[float, float]]:
+    """
+    returns osmid -> (lat, lon) of the written intersections
+    """
+    nodes: dict[int, dict[str, Any]] = {}
+    for row in with_content_hash(iter_dataset('road_nodes')):
+        osmid = row['osmid']
+        if osmid is not None:
+            nodes[osmid] = row
+
+    _write(
+        files,
+        out_dir.joinpath('intersections.csv'),
+        [':ID(Intersection)', 'osmid:long', _POINT, 'ref', 'highway',
+         'street_count:long', 'content_hash', ':LABEL'],
+        (
+            [osmid, osmid, _point(r['y'], r['x']), r['ref'], r['highway'],
+             r['street_count'], r['content_hash'], 'Intersection']
+            for osmid, r in nodes.items()
+        ),
+    )
+    return {
+        osmid: (float(r['y']), float(r['x'])) for osmid, r in nodes.items()
+    }
+
+
+def _write_road_segments(
+    out_dir: Path, files: ImportFiles, intersections: set[int]
+) -> None:
+    # the loader MERGEs on (u, v, osmid), the last row wins
+    segments: dict[tuple[int, int, int], dict[str, Any]] = {}
+    for row in with_content_hash(with_travel_time(iter_dataset('road_rels'))):
+        u, v = row['u'], row['v']
+        if u not in intersections or v not in intersections:
+            continue
+        # merged ways have no single osmid
+        osmid = row['osmid']
+        segments[(u, v, -1 if osmid is None else osmid)] = row
+
+    _write(
+        files,
+        out_dir.joinpath('road_segments.csv'),
+        [':START_ID(Intersection)', ':END_ID(Intersection)', 'osmid:long',
+         'oneway:boolean', 'lanes:int', 'ref', 'name', 'highway',
+         'max_speed:double', 'speed:double', 'length:double',
+         'travel_time:double', 'content_hash', ':TYPE'],
+        (
+            [u, v, osmid, r['oneway'], r['lanes'], r['ref'], r['name'],
+             r['highway'], r['maxspeed'], r['speed'], r['length'],
+             r['travel_time'], r['content_hash'], 'ROAD_SEGMENT']
+            for (u, v, osmid), r in segments.items()
+        ),
+        relationships=True,
+    )
+
+
+def _full_address(tags: dict[str, Any]) -> str | None:
+    keys = ('addr_street', 'addr_housenumber', 'addr_city', 'addr_postcode')
+    if any(tags.get(k) is None for k in keys):
+        return None
+    return (
+        f'{tags["addr_street"]} {tags["addr_housenumber"]} '
+        f'{tags["addr_city"]}, {tags["addr_postcode"]}, Czech Republic'
+    )
+
+
+def _write_addresses(
+    out_dir: Path, files: ImportFiles
+) -> dict[int, tuple[float, float]]:
+    """
+    returns id -> (lat, lon) of the written addresses
+    """
+    addresses: dict[int, dict[str, Any]] = {}
+    for row in with_content_hash(iter_dataset('address')):
+        id_ = row['id']
+        if id_ is not None:
+            addresses[id_] = row
+
+    _write(
+        files,
+        out_dir.joinpath('addresses.csv'),
+        [':ID(Address)', 'id:long', _POINT, 'full_address', _TAGS,
+         'content_hash', ':LABEL'],
+        (
+            [id_, id_, _point(r['lat'], r['lon']), _full_address(r['tags']),
+             _tags(r['tags']), r['content_hash'], 'Address']
+            for id_, r in addresses.items()
+        ),
+    )
+    return {
+        id_: (float(r['lat']), float(r['lon']))
+        for id_, r in addresses.items()
+    }
+
+
+def _write_nearest_intersections(
+    out_dir: Path,
+    files: ImportFiles,
+    intersections: dict[int, tuple[float, float]],
+    addresses: dict[int, tuple[float, float]],
+    max_distance: float,
+) -> None:
+    i_osmid = np.fromiter(intersections, dtype=np.int64)
+    i_lat, i_lon = np.array(list(intersections.values())).reshape(-1, 2).T
+    a_id = np.fromiter(addresses, dtype=np.int64)
+    a_lat, a_lon = np.array(list(addresses.values())).reshape(-1, 2).T
+    idx, length = snap_to_nearest(a_lat, a_lon, i_lat, i_lon, max_distance) \
+        if len(i_osmid) and len(a_id) \
+        else (np.full(len(a_id), -1), np.full(len(a_id), np.inf))
+    found = idx >= 0
+
+    _write(
+        files,
+        out_dir.joinpath('nearest_intersections.csv'),
+        [':START_ID(Address)', ':END_ID(Intersection)', 'length:double',
+         ':TYPE'],
+        (
+            [id_, osmid, d, 'NEAREST_INTERSECTION']
+            for id_, osmid, d in zip(
+                a_id[found].tolist(),
+                i_osmid[idx[found]].tolist(),
+                length[found].tolist(),
+            )
+        ),
+        relationships=True,
+    )
+
+
+def _poi_labels(row: dict[str, Any]) -> str:
+    return ';'.join(
+        label for label in ('PointOfInterest', row['class'], row['subclass'])
+        if label
+    )
+
+
+def _write_poi_compact(out_dir: Path, files: ImportFiles) -> None:
+    _write(
+        files,
+        out_dir.joinpath('poi.csv'),
+        ['id:long', 'name', _POINT, 'tags', 'content_hash', ':LABEL'],
+        (
+            [r['id'], r['name'], _point(r['lat'], r['lon']),
+             _tags(r['tags']), r['content_hash'],
+             _poi_labels(r)]
+            for r in with_content_hash(iter_dataset('poi'))
+        ),
+    )
+
+
+def _write_poi_graph(out_dir: Path, files: ImportFiles) -> None:
+    # the row number identifies a POI and its Geometry and Tags nodes
+    _write(
+        files,
+        out_dir.joinpath('poi.csv'),
+        [':ID(PointOfInterest)', 'id:long', 'name', 'content_hash', ':LABEL'],
+        (
+            [i, r['id'], r['name'], r['content_hash'], _poi_labels(r)]
+            for i, r in enumerate(with_content_hash(iter_dataset('poi')))
+        ),
+    )
+    _write(
+        files,
+        out_dir.joinpath('poi_geometry.csv'),
+        [':ID(Geometry)', _POINT, ':LABEL'],
+        (
+            [i, _point(r['lat'], r['lon']), 'Geometry;Point']
+            for i, r in enumerate(iter_dataset('poi'))
+        ),
+    )
+    _write(
+        files,
+        out_dir.joinpath('poi_tags.csv'),
+        [':ID(Tags)', _TAGS, ':LABEL'],
+        (
+            [i, _tags(r['tags']), 'Tags']
+            for i, r in enumerate(iter_dataset('poi'))
+        ),
+    )
+    n = files.rows['poi']
+    _write(
+        files,
+        out_dir.joinpath('poi_has_geometry.csv'),
+        [':START_ID(PointOfInterest)', ':END_ID(Geometry)', ':TYPE'],
+        ([i, i, 'HAS_GEOMETRY'] for i in range(n)),
+        relationships=True,
+    )
+    _write(
+        files,
+        out_dir.joinpath('poi_has_tags.csv'),
+        [':START_ID(PointOfInterest)', ':END_ID(Tags)', ':TYPE'],
+        ([i, i, 'HAS_TAGS'] for i in range(n)),
+        relationships=True,
+    )
+
+
+def expand_imported_tags() -> None:
+    """
+    turn the json tag column of imported Address and Tags nodes into
+    properties named by the original keys, as the loaders set them,
+    nodes without the column (loaded online or expanded before) are skipped
+    """
+    from be.neo import driver
+    from be.neo import neo_run
+    query = '''
+        CALL apoc.periodic.iterate(
+            'MATCH (n) WHERE (n:Address OR n:Tags) AND n.tags_json IS NOT NULL
+            RETURN n',
+            'SET n += apoc.map.removeKeys(
+                apoc.convert.fromJsonMap(n.tags_json),
+                CASE WHEN n:Address THEN $reserved ELSE [] END
+            )
+            REMOVE n.tags_json',
+            {batchSize: 1000, parallel: false, params: {reserved: $reserved}}
+        )
+    '''
+    with driver.session() as session:
+        session.execute_write(
+            neo_run,
+            query=query,
+            params={'reserved': list(_ADDRESS_PROPERTIES)},
+            name='expand_imported_tags',
+        )
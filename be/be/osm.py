@@ -2,45 +2,56 @@
 optional module
 (only for downloading data)
 """
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from hashlib import sha256
+from json import load
+from math import ceil
+from math import sqrt
+from os import replace
+from pathlib import Path
+from random import random
+from time import sleep
 from typing import Literal
 from typing import Any
+from typing import Iterator
+from typing import Sequence
 from be.config import settings
+from be.utils import DATASET_COLUMNS
+from be.utils import as_str
+from be.utils import dataset_path
+from be.utils import write_dataset
 
 
-_OSM_BBOX_FORMAT = '[bbox:{lon_min},{lat_min},{lon_max},{lat_max}]'
+# overpass bboxes are south, west, north, east
+_OSM_BBOX_FORMAT = '[bbox:{lat_min},{lon_min},{lat_max},{lon_max}]'
 _OSM_NOMINATIM_URL = 'https://nominatim.openstreetmap.org'
-_OSM_OVERPASS_URL = 'https://overpass-api.de/api/interpreter'
+# overpass answers these when it is overloaded or the query timed out
+_OVERPASS_TRANSIENT_STATUS = (429, 502, 503, 504)
 
 
 def download_prague_address_data() -> None:
-    from requests import post as POST
-    from pandas import DataFrame
-    resp = POST(
-        url=_OSM_OVERPASS_URL,
-        data={
-            'data': '''
-                [out:json];
-                area["name"="Praha"]->.searchArea;
-                (
-                    node(area.searchArea)["addr:housenumber"~"."]["addr:street"~"."];
-                );
-                out center;
-            '''
-        }
-    )
-    elements: list[dict[str, Any]] = resp.json()['elements']
-    for address in elements:
-        for k in address.copy():
-            if ':' in k:
-                address[k.replace(':', '_')] = address.pop(k)
-            if 'tags' == k and isinstance(address['tags'], dict):
-                for kt in address['tags'].copy():
-                    address['tags'][kt.replace(':', '_')] = \
-                        address['tags'].pop(kt)
-    
-    DataFrame.from_records(elements).to_csv(
-        settings.DATA_DIR.joinpath(settings.DS_ADDRESS_PRG_NODES_FILENAME),
-        index=False
+    query = '''
+        [out:json];
+        area["name"="Praha"]->.searchArea;
+        (
+            node(area.searchArea)["addr:housenumber"~"."]["addr:street"~"."];
+        );
+        out center;
+    '''
+    write_dataset(
+        path=dataset_path('address'),
+        columns=DATASET_COLUMNS['address'],
+        rows=(
+            {
+                **address,
+                'tags': {
+                    k.replace(':', '_'): v
+                    for k, v in address.get('tags', {}).items()
+                },
+            }
+            for address in download_overpass([query])
+        )
     )
 
 
@@ -50,19 +61,18 @@ def download_prague_poi_data() -> None:
     equivalent for Prague
     """
     from requests import get as GET
-    from requests import post as POST
-    from pandas import DataFrame
     from pandas import read_html
 
     url = f"{_OSM_NOMINATIM_URL}/details.php?" + \
         "osmtype=R&osmid=439840&class=boundary&addressdetails=1&" + \
         "hierarchy=0&group_hierarchy=1&polygon_geojson=1&format=json"
 
-    resp_nominatim = GET(url=url)
+    resp_nominatim = GET(url=url, timeout=60)
+    # geojson coordinates are (lon, lat)
     coords = resp_nominatim.json()['geometry']['coordinates'][0]
 
-    lat_min, lat_max = min(c[0] for c in coords), max(c[0] for c in coords)
-    lon_min, lon_max = min(c[1] for c in coords), max(c[1] for c in coords)
+    lat_min, lat_max = min(c[1] for c in coords), max(c[1] for c in coords)
+    lon_min, lon_max = min(c[0] for c in coords), max(c[0] for c in coords)
 
     tables = read_html('https://daylightmap.org/earth/poi.html')
     df_meta = tables[1]
@@ -72,8 +82,8 @@ def download_prague_poi_data() -> None:
     subclass_to_class_map = dict(zip(df_meta['Subclass'], df_meta['Class']))
     search_tags = unique_classes + unique_subclasses
     search_nodes = [f'node["{tag}"];' for tag in search_tags]
-    nodes = []
 
+    queries = []
     for ch in _split_bbox_into_chunks(
         lat_min  = lat_min,
         lat_max  = lat_max,
@@ -87,42 +97,15 @@ def download_prague_poi_data() -> None:
             lon_max=ch['lon_max'],
             lat_max=ch['lat_max'],
         )
-        request_data = {
-            'data': f'''
-                [timeout:200]
-                [out:json]
-                {bbox};
-                (
-                    {''.join(search_nodes)}
-                );
-                out center;
-                out meta;
-            '''
-        }
-
-        print('Downloading chunk:', bbox)
-
-        resp_overpass = POST(
-            url=_OSM_OVERPASS_URL,
-            headers={
-                'Accept-Encoding': 'gzip, deflate, br'
-            },
-            data=request_data
-        )
-        assert resp_overpass.status_code == 200, resp_overpass.text
-
-        j = resp_overpass.json()
-        assert isinstance(j, dict), type(j)
-
-        if 'elements' in j and isinstance(j['elements'], list):
-            nodes.extend(j['elements'])
-        
-    df_nodes = DataFrame.from_records(nodes)
-    df_nodes = df_nodes.drop(columns=[
-        'type', 'timestamp', 'version', 'changeset', 'user', 'uid'
-        ]
-    )
-    df_nodes = df_nodes.drop_duplicates(subset=['id'])
+        queries.append(f'''
+            [timeout:200]
+            [out:json]
+            {bbox};
+            (
+                {''.join(search_nodes)}
+            );
+            out;
+        ''')
 
     def get_name_from_tags(tags: dict) -> str:
         if 'name' in tags:
@@ -147,16 +130,122 @@ def download_prague_poi_data() -> None:
                 return tags[cls]
         return 'unknown'
 
-    df_nodes['name'] = df_nodes['tags'].apply(get_name_from_tags)
-    df_nodes['class'] = df_nodes['tags'].apply(get_class_from_tags)
-    df_nodes['subclass'] = df_nodes['tags'].apply(get_subclass_from_tags)
+    def iter_pois() -> Iterator[dict[str, Any]]:
+        # nodes on the border of two chunks are returned by both
+        seen: set[int] = set()
+        for node in download_overpass(queries):
+            if node['id'] in seen:
+                continue
+            seen.add(node['id'])
+            tags = node.get('tags', {})
+            yield {
+                **node,
+                'tags': tags,
+                'name': get_name_from_tags(tags),
+                'class': get_class_from_tags(tags),
+                'subclass': get_subclass_from_tags(tags),
+            }
 
-    df_nodes.to_csv(
-        settings.DATA_DIR.joinpath(settings.DS_POI_PRG_NODES_FILENAME),
-        index=False
+    write_dataset(
+        path=dataset_path('poi'),
+        columns=DATASET_COLUMNS['poi'],
+        rows=iter_pois()
     )
 
 
+def download_overpass(
+    queries: Sequence[str],
+    url: str | None = None,
+    cache_dir: Path | str | None = None,
+    workers: int | None = None,
+    retries: int | None = None,
+    backoff: float = 1.0,
+) -> Iterator[dict[str, Any]]:
+    """
+    elements returned by overpass for every query, `workers` queries run
+    concurrently, each response is cached on disk under a hash of its query
+    so a rerun only fetches the missing ones, elements of a query are
+    yielded as soon as it completes, failed queries are raised at the end
+    """
+    url = url or settings.OSM_OVERPASS_URL
+    cache_dir = Path(cache_dir or settings.DATA_DIR.joinpath('overpass'))
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or settings.OSM_DOWNLOAD_WORKERS
+    retries = settings.OSM_DOWNLOAD_RETRIES if retries is None else retries
+
+    errors: list[BaseException] = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _fetch_overpass, url, query, cache_dir, retries, backoff
+            )
+            for query in queries
+        ]
+        for future in as_completed(futures):
+            try:
+                path = future.result()
+            except Exception as e:
+                print(f'Chunk failed: {e}')
+                errors.append(e)
+                continue
+            with open(path, encoding='utf-8') as f:
+                yield from load(f).get('elements', [])
+    if errors:
+        raise RuntimeError(
+            f'{len(errors)} of {len(queries)} overpass queries failed, '
+            'rerun to fetch them, completed ones are cached'
+        ) from errors[0]
+
+
+def _fetch_overpass(
+    url: str, query: str, cache_dir: Path, retries: int, backoff: float
+) -> Path:
+    """
+    path of the cached response of `query`, fetched with exponential
+    backoff on connection errors and overloaded servers
+    """
+    from requests import post as POST
+    from requests import RequestException
+
+    key = sha256(f'{url}\n{query}'.encode('utf-8')).hexdigest()
+    path = cache_dir.joinpath(f'{key}.json')
+    if path.exists():
+        return path
+
+    error: BaseException | None = None
+    for attempt in range(retries + 1):
+        if attempt:
+            sleep(backoff * 2 ** (attempt - 1) * (1 + random()))
+        try:
+            resp = POST(
+                url=url,
+                headers={'Accept-Encoding': 'gzip, deflate'},
+                data={'data': query},
+                timeout=300
+            )
+        except RequestException as e:
+            error = e
+            continue
+        if resp.status_code in _OVERPASS_TRANSIENT_STATUS:
+            error = RuntimeError(f'overpass returned {resp.status_code}')
+            continue
+        if resp.status_code != 200:
+            raise RuntimeError(
+                f'overpass returned {resp.status_code}: {resp.text[:500]}'
+            )
+        # a query that timed out on the server still returns 200
+        remark = resp.json().get('remark', '')
+        if 'error' in remark:
+            error = RuntimeError(f'overpass error: {remark}')
+            continue
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_bytes(resp.content)
+        replace(tmp, path)
+        return path
+    assert error is not None
+    raise error
+
+
 def download_prague_road_data() -> None:
     from osmnx import graph_from_place
     from osmnx import graph_to_gdfs
@@ -176,15 +265,16 @@ def download_prague_road_data() -> None:
     if 'geometry' in gdf_relationships.columns:
         gdf_relationships.drop(columns=['geometry'], inplace=True)
 
-    gdf_nodes.to_csv(
-        settings.DATA_DIR.joinpath(settings.DS_ROAD_PRG_NODES_FILENAME),
-        index=False
-    )
-
-    gdf_relationships.to_csv(
-        settings.DATA_DIR.joinpath(settings.DS_ROAD_PRG_RELS_FILENAME),
-        index=False
-    )
+    # columns beyond the typed ones are kept as strings
+    for dataset, gdf in (
+        ('road_nodes', gdf_nodes), ('road_rels', gdf_relationships)
+    ):
+        columns = DATASET_COLUMNS[dataset]
+        write_dataset(
+            path=dataset_path(dataset),
+            columns={c: columns.get(c, as_str) for c in gdf.columns},
+            rows=gdf.to_dict('records')
+        )
 
 
 def _split_bbox_into_chunks(
@@ -194,17 +284,17 @@ def _split_bbox_into_chunks(
     lon_max: float,
     n_chunks: int,
 ) -> list[dict[Literal["lat_min", "lat_max", "lon_min", "lon_max"], float]]:
-    n = int(n_chunks**1/2) + 1
+    n = ceil(sqrt(n_chunks))
     lat_step = (lat_max - lat_min) / n
     lon_step = (lon_max - lon_min) / n
     chunks = []
-    for i in range(1, n, 1):
-        for j in range(1, n, 1):
+    for i in range(n):
+        for j in range(n):
             d = dict(
-                lat_min=lat_min+lat_step*(i-1),
-                lat_max=lat_min+lat_step*i,
-                lon_min=lon_min+lon_step*(j-1),
-                lon_max=lon_min+lon_step*j,
+                lat_min=lat_min+lat_step*i,
+                lat_max=lat_min+lat_step*(i+1),
+                lon_min=lon_min+lon_step*j,
+                lon_max=lon_min+lon_step*(j+1),
             )
             chunks.append(d)
-    return chunks
\ No newline at end of file
+    return chunks
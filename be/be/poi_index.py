@@ -0,0 +1,195 @@
+from dataclasses import dataclass
+from datetime import datetime
+from sys import getsizeof
+from threading import Lock
+from typing import Sequence
+from orjson import Fragment
+import numpy as np
+from be.config import settings
+from be.schemas.routing import PointOfInterest
+from be.spatial import GridIndex
+from be.spatial import build_grid_index
+
+
+# a record validated from Neo4j rows, or the json of one stored in
+# a snapshot, both are encoded into responses as they are
+PoiRecord = PointOfInterest | Fragment
+
+
+@dataclass
+class PoiIndex:
+    """
+    all POIs held in memory, `grid` offsets point into `records`,
+    `ids` holds the POI id of every record (stable across rebuilds, unlike
+    offsets), `label_grids` holds a grid over the records of every category
+    label, sharing the coordinates of `grid`
+    """
+
+    records: Sequence[PoiRecord]
+    ids: np.ndarray
+    grid: GridIndex
+    label_grids: dict[str, GridIndex]
+    built_at: datetime
+    records_nbytes: int
+
+    @property
+    def nbytes(self) -> int:
+        return self.grid.nbytes + self.records_nbytes + self.ids.nbytes + \
+            sum(
+                grid.keys.nbytes + grid.offsets.nbytes
+                for grid in self.label_grids.values()
+            )
+
+    def nearest(
+        self, lat: float, lon: float, k: int, label: str = 'PointOfInterest'
+    ) -> tuple[list[PoiRecord], np.ndarray]:
+        """
+        `k` records with `label` nearest to the point and their distances
+        """
+        grid = self.label_grids.get(label)
+        if grid is None:
+            return [], np.empty(0)
+        found, dist = grid.nearest(lat, lon, k)
+        return [self.records[i] for i in found.tolist()], dist
+
+    def within_bbox(
+        self,
+        lat_min: float,
+        lat_max: float,
+        lon_min: float,
+        lon_max: float,
+    ) -> list[PoiRecord]:
+        offsets = self.grid.within_bbox(lat_min, lat_max, lon_min, lon_max)
+        return [self.records[i] for i in offsets.tolist()]
+
+    def within_radius(
+        self, lat: float, lon: float, radius: float
+    ) -> list[PoiRecord]:
+        offsets, _ = self.grid.within_radius(lat, lon, radius)
+        return [self.records[i] for i in offsets.tolist()]
+
+
+def load_poi_index() -> PoiIndex:
+    return build_poi_index(*load_poi_records())
+
+
+def load_poi_records() -> tuple[list[PointOfInterest], np.ndarray]:
+    """
+    every POI in Neo4j and its id
+    """
+    from be.neo import driver
+    from be.neo import neo_query
+    if settings.POI_SCHEMA == 'compact':
+        query = '''
+            MATCH (poi:PointOfInterest)
+            RETURN poi {
+                latitude: poi.location.latitude,
+                longitude: poi.location.longitude,
+                name: poi.name,
+                categories: labels(poi),
+                tags: apoc.convert.fromJsonMap(poi.tags)
+            }
+            AS point, coalesce(poi.id, -1) AS id
+        '''
+    else:
+        query = '''
+            MATCH
+                (p:Point)-[:HAS_GEOMETRY]-(poi:PointOfInterest)-[:HAS_TAGS]->(t:Tags)
+            RETURN p {
+                latitude: p.location.latitude,
+                longitude: p.location.longitude,
+                name: poi.name,
+                categories: labels(poi),
+                tags: t{.*}
+            }
+            AS point, coalesce(poi.id, -1) AS id
+        '''
+    with driver.session() as session:
+        data = neo_query(session, 'poi_index', query=query)
+    records = [PointOfInterest.from_python(obj['point']) for obj in data]
+    ids = np.fromiter((obj['id'] for obj in data), dtype=np.int64)
+    return records, ids
+
+
+def build_poi_index(
+    records: Sequence[PointOfInterest], ids: np.ndarray
+) -> PoiIndex:
+    lat = np.fromiter((r.latitude for r in records), dtype=np.float64)
+    lon = np.fromiter((r.longitude for r in records), dtype=np.float64)
+    return PoiIndex(
+        records=records,
+        ids=ids,
+        grid=build_grid_index(lat, lon, cell_size=settings.POI_INDEX_CELL_SIZE),
+        label_grids={
+            label: build_grid_index(
+                lat,
+                lon,
+                cell_size=settings.POI_INDEX_CELL_SIZE,
+                subset=offsets,
+            )
+            for label, offsets in build_label_offsets(records).items()
+        },
+        built_at=datetime.utcnow(),
+        records_nbytes=sum(poi_nbytes(r) for r in records),
+    )
+
+
+def build_label_offsets(
+    records: Sequence[PointOfInterest]
+) -> dict[str, np.ndarray]:
+    offsets: dict[str, list[int]] = {}
+    for i, record in enumerate(records):
+        for label in record.categories:
+            offsets.setdefault(label, []).append(i)
+    return {
+        label: np.array(x, dtype=np.int64) for label, x in offsets.items()
+    }
+
+
+def poi_nbytes(record: PointOfInterest) -> int:
+    """
+    rough size of a record, the model plus its fields and tags
+    """
+    size = getsizeof(record) + getsizeof(record.__dict__)
+    size += getsizeof(record.name) + getsizeof(record.categories)
+    size += sum(getsizeof(c) for c in record.categories)
+    size += getsizeof(record.tags)
+    size += sum(getsizeof(k) + getsizeof(v) for k, v in record.tags.items())
+    return size
+
+
+_poi_index: PoiIndex | None = None
+_poi_index_lock = Lock()
+
+
+def get_poi_index() -> PoiIndex:
+    """
+    process-wide POI index, built on first use
+    """
+    if _poi_index is None:
+        return refresh_poi_index(only_missing=True)
+    return _poi_index
+
+
+def peek_poi_index() -> PoiIndex | None:
+    """
+    the index if it has been built, without building it
+    """
+    return _poi_index
+
+
+def refresh_poi_index(only_missing: bool = False) -> PoiIndex:
+    """
+    rebuild the index from Neo4j (or re-open the snapshot),
+    readers keep using the previous one until the new one is swapped in
+    """
+    global _poi_index
+    with _poi_index_lock:
+        if only_missing and _poi_index is not None:
+            return _poi_index
+        if settings.USE_SNAPSHOT:
+            from be.snapshot import get_snapshot
+            _poi_index = get_snapshot(reload=not only_missing).poi_index()
+        else:
+            _poi_index = load_poi_index()
+        return _poi_index
@@ -0,0 +1,314 @@
+from dataclasses import dataclass
+from heapq import heapify
+from heapq import heappush
+from heapq import heappop
+from math import inf
+from pathlib import Path
+from threading import Lock
+import numpy as np
+from be.config import settings
+from be.routing.graph import RoadGraph
+
+
+@dataclass
+class ContractionHierarchy:
+    """
+    `up` holds edges from lower to higher ranked nodes in their direction,
+    `down` holds edges from higher to lower ranked nodes stored reversed
+    (at the lower ranked head), so both searches only ever move upwards,
+    `*_middle` is the contracted node a shortcut skips, -1 for road segments
+    """
+
+    rank: np.ndarray
+    up: RoadGraph
+    up_middle: np.ndarray
+    down: RoadGraph
+    down_middle: np.ndarray
+
+    @property
+    def n_shortcuts(self) -> int:
+        return int((self.up_middle >= 0).sum() + (self.down_middle >= 0).sum())
+
+
+def build_contraction_hierarchy(
+    graph: RoadGraph, witness_limit: int = 500
+) -> ContractionHierarchy:
+    """
+    contract nodes one by one in edge-difference order, adding a shortcut
+    whenever a limited witness search finds no path around the contracted node
+    """
+    n = graph.n_nodes
+    indptr, indices, weights = graph.adjacency
+
+    # remaining graph, out[u][v] = inc[v][u] = (weight, middle)
+    out: list[dict[int, tuple[float, int]]] = [{} for _ in range(n)]
+    inc: list[dict[int, tuple[float, int]]] = [{} for _ in range(n)]
+    for u in range(n):
+        for e in range(indptr[u], indptr[u + 1]):
+            v, w = indices[e], weights[e]
+            if u != v and w < out[u].get(v, (inf, -1))[0]:
+                out[u][v] = inc[v][u] = (w, -1)
+
+    def get_shortcuts(v: int) -> list[tuple[int, int, float]]:
+        shortcuts = []
+        for u, (wu, _) in inc[v].items():
+            targets = {x: wu + wx for x, (wx, _) in out[v].items() if x != u}
+            if not targets:
+                continue
+            dist = _witness_search(
+                out, u, v, targets, max(targets.values()), witness_limit
+            )
+            for x, d in targets.items():
+                if dist.get(x, inf) > d:
+                    shortcuts.append((u, x, d))
+        return shortcuts
+
+    rank = np.full(n, -1, dtype=np.int32)
+    contracted_neighbours = [0] * n
+    up_edges: list[tuple[int, int, float, int]] = []
+    down_edges: list[tuple[int, int, float, int]] = []
+
+    def get_priority(v: int, shortcuts: list) -> int:
+        return len(shortcuts) - len(inc[v]) - len(out[v]) + \
+            contracted_neighbours[v]
+
+    heap = [(get_priority(v, get_shortcuts(v)), v) for v in range(n)]
+    heapify(heap)
+    order = 0
+    while heap:
+        _, v = heappop(heap)
+        shortcuts = get_shortcuts(v)
+        priority = get_priority(v, shortcuts)
+        # lazy update, neighbours' priorities change as the graph shrinks
+        if heap and priority > heap[0][0]:
+            heappush(heap, (priority, v))
+            continue
+
+        for u, x, d in shortcuts:
+            if d < out[u].get(x, (inf, -1))[0]:
+                out[u][x] = inc[x][u] = (d, v)
+        for x, (w, middle) in out[v].items():
+            up_edges.append((v, x, w, middle))
+            del inc[x][v]
+            contracted_neighbours[x] += 1
+        for u, (w, middle) in inc[v].items():
+            down_edges.append((v, u, w, middle))
+            del out[u][v]
+            contracted_neighbours[u] += 1
+        out[v], inc[v] = {}, {}
+        rank[v] = order
+        order += 1
+
+    up, up_middle = _build_csr(graph, up_edges)
+    down, down_middle = _build_csr(graph, down_edges)
+    return ContractionHierarchy(
+        rank=rank,
+        up=up,
+        up_middle=up_middle,
+        down=down,
+        down_middle=down_middle,
+    )
+
+
+def _witness_search(
+    out: list[dict[int, tuple[float, int]]],
+    source: int,
+    skip: int,
+    targets: dict[int, float],
+    max_dist: float,
+    limit: int,
+) -> dict[int, float]:
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    settled, remaining = 0, len(targets)
+    while heap and settled < limit and remaining:
+        d, u = heappop(heap)
+        if d > dist[u]:
+            continue
+        if d > max_dist:
+            break
+        settled += 1
+        if u in targets:
+            remaining -= 1
+        for v, (w, _) in out[u].items():
+            if v == skip:
+                continue
+            dv = d + w
+            if dv < dist.get(v, inf):
+                dist[v] = dv
+                heappush(heap, (dv, v))
+    return dist
+
+
+def _build_csr(
+    graph: RoadGraph, edges: list[tuple[int, int, float, int]]
+) -> tuple[RoadGraph, np.ndarray]:
+    src = np.fromiter((e[0] for e in edges), dtype=np.int64, count=len(edges))
+    dst = np.fromiter((e[1] for e in edges), dtype=np.int32, count=len(edges))
+    w = np.fromiter((e[2] for e in edges), dtype=np.float64, count=len(edges))
+    mid = np.fromiter((e[3] for e in edges), dtype=np.int32, count=len(edges))
+    order = np.argsort(src, kind='stable')
+    indptr = np.zeros(graph.n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=graph.n_nodes), out=indptr[1:])
+    csr = RoadGraph(
+        osmids=graph.osmids,
+        lat=graph.lat,
+        lon=graph.lon,
+        indptr=indptr,
+        indices=dst[order],
+        weights=w[order],
+    )
+    return csr, mid[order]
+
+
+def ch_shortest_path(
+    ch: ContractionHierarchy, source: int, target: int
+) -> tuple[float, list[int]] | None:
+    """
+    bidirectional upward search, returns (distance, node indices)
+    of the original road graph or None if target is unreachable
+    """
+    searches = [
+        (ch.up.adjacency, {source: 0.0}, {source: -1}, [(0.0, source)]),
+        (ch.down.adjacency, {target: 0.0}, {target: -1}, [(0.0, target)]),
+    ]
+    best, meet = inf, -1
+    while searches[0][3] or searches[1][3]:
+        fwd, bwd = searches[0][3], searches[1][3]
+        side = 0 if fwd and (not bwd or fwd[0][0] <= bwd[0][0]) else 1
+        (indptr, indices, weights), dist, pred, heap = searches[side]
+        other_dist = searches[1 - side][1]
+
+        d, u = heappop(heap)
+        if d > dist[u]:
+            continue
+        if d >= best:
+            heap.clear()
+            continue
+        if u in other_dist and d + other_dist[u] < best:
+            best, meet = d + other_dist[u], u
+        for e in range(indptr[u], indptr[u + 1]):
+            v = indices[e]
+            dv = d + weights[e]
+            if dv < dist.get(v, inf):
+                dist[v] = dv
+                pred[v] = u
+                heappush(heap, (dv, v))
+
+    if meet == -1:
+        return None
+
+    fwd_pred, bwd_pred = searches[0][2], searches[1][2]
+    shortcut_path = [meet]
+    while fwd_pred[shortcut_path[-1]] != -1:
+        shortcut_path.append(fwd_pred[shortcut_path[-1]])
+    shortcut_path.reverse()
+    while bwd_pred[shortcut_path[-1]] != -1:
+        shortcut_path.append(bwd_pred[shortcut_path[-1]])
+
+    path = [source]
+    for a, b in zip(shortcut_path, shortcut_path[1:]):
+        path.extend(_unpack(ch, a, b))
+    return best, path
+
+
+def _unpack(ch: ContractionHierarchy, a: int, b: int) -> list[int]:
+    """
+    original nodes of edge a -> b, excluding a
+    """
+    nodes = []
+    stack = [(a, b)]
+    while stack:
+        x, y = stack.pop()
+        middle = _middle(ch, x, y)
+        if middle == -1:
+            nodes.append(y)
+        else:
+            stack.append((middle, y))
+            stack.append((x, middle))
+    return nodes
+
+
+def _middle(ch: ContractionHierarchy, x: int, y: int) -> int:
+    if ch.rank[x] < ch.rank[y]:
+        indptr, indices, _ = ch.up.adjacency
+        middles, tail, head = ch.up_middle, x, y
+    else:
+        indptr, indices, _ = ch.down.adjacency
+        middles, tail, head = ch.down_middle, y, x
+    for e in range(indptr[tail], indptr[tail + 1]):
+        if indices[e] == head:
+            return int(middles[e])
+    raise ValueError(f'missing hierarchy edge {x} -> {y}')
+
+
+def save_contraction_hierarchy(
+    ch: ContractionHierarchy, path: Path | str
+) -> None:
+    np.savez(
+        path,
+        osmids=ch.up.osmids,
+        lat=ch.up.lat,
+        lon=ch.up.lon,
+        rank=ch.rank,
+        up_indptr=ch.up.indptr,
+        up_indices=ch.up.indices,
+        up_weights=ch.up.weights,
+        up_middle=ch.up_middle,
+        down_indptr=ch.down.indptr,
+        down_indices=ch.down.indices,
+        down_weights=ch.down.weights,
+        down_middle=ch.down_middle,
+    )
+
+
+def load_contraction_hierarchy(path: Path | str) -> ContractionHierarchy:
+    with np.load(path) as f:
+        arrays = {k: f[k] for k in f.files}
+    up, down = (
+        RoadGraph(
+            osmids=arrays['osmids'],
+            lat=arrays['lat'],
+            lon=arrays['lon'],
+            indptr=arrays[f'{side}_indptr'],
+            indices=arrays[f'{side}_indices'],
+            weights=arrays[f'{side}_weights'],
+        )
+        for side in ('up', 'down')
+    )
+    return ContractionHierarchy(
+        rank=arrays['rank'],
+        up=up,
+        up_middle=arrays['up_middle'],
+        down=down,
+        down_middle=arrays['down_middle'],
+    )
+
+
+_contraction_hierarchy: ContractionHierarchy | None = None
+_contraction_hierarchy_lock = Lock()
+
+
+def get_contraction_hierarchy() -> ContractionHierarchy:
+    """
+    process-wide hierarchy, loaded on first use from the file
+    written by `cli.py db build-ch`
+    """
+    global _contraction_hierarchy
+    if _contraction_hierarchy is None:
+        with _contraction_hierarchy_lock:
+            if _contraction_hierarchy is None:
+                _contraction_hierarchy = load_contraction_hierarchy(
+                    settings.DATA_DIR.joinpath(settings.DS_ROAD_PRG_CH_FILENAME)
+                )
+    return _contraction_hierarchy
+
+
+def reset_contraction_hierarchy() -> None:
+    """
+    load the hierarchy from its file again on next use,
+    e.g. once it was rebuilt for reloaded road data
+    """
+    global _contraction_hierarchy
+    with _contraction_hierarchy_lock:
+        _contraction_hierarchy = None
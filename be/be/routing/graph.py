@@ -0,0 +1,286 @@
+from dataclasses import dataclass
+from functools import cached_property
+from threading import Lock
+from typing import Any
+from typing import Iterable
+import numpy as np
+from be.config import settings
+from be.routing.weights import DEFAULT_SPEED
+from be.routing.weights import Weight
+from be.routing.weights import with_travel_time
+from be.utils import iter_dataset
+
+
+@dataclass
+class RoadGraph:
+    """
+    road network in compressed sparse row (CSR) form,
+    nodes are sorted by osmid, outgoing edges of node `i` are
+    `indices[indptr[i]:indptr[i+1]]` with `weights` at the same positions
+    """
+
+    osmids: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+    weights: np.ndarray
+    # seconds per edge at the same positions, `weights` are lengths
+    travel_times: np.ndarray | None = None
+    # lower bound of the weight of a meter of great-circle distance,
+    # keeps the A* heuristic admissible whatever the weights are
+    cost_per_meter: float = 1.0
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.osmids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            arr.nbytes for arr in (
+                self.osmids,
+                self.lat,
+                self.lon,
+                self.indptr,
+                self.indices,
+                self.weights,
+                *([] if self.travel_times is None else [self.travel_times]),
+            )
+        )
+
+    # python lists are much faster to index from the search loops than
+    # numpy arrays, they are built once on first use
+    @cached_property
+    def adjacency(self) -> tuple[list[int], list[int], list[float]]:
+        return (
+            self.indptr.tolist(),
+            self.indices.tolist(),
+            self.weights.tolist()
+        )
+
+    def weighted_by(self, weight: Weight) -> 'RoadGraph':
+        """
+        the same graph with `weight` as edge weights, arrays are shared
+        """
+        if weight == 'length':
+            return self
+        if self.travel_times is None:
+            raise ValueError('road graph has no travel times')
+        moving = self.travel_times > 0
+        max_speed = float(np.max(
+            self.weights[moving] / self.travel_times[moving], initial=1.0
+        ))
+        return RoadGraph(
+            osmids=self.osmids,
+            lat=self.lat,
+            lon=self.lon,
+            indptr=self.indptr,
+            indices=self.indices,
+            weights=self.travel_times,
+            cost_per_meter=1.0 / max_speed,
+        )
+
+    def node_index(self, osmid: int) -> int | None:
+        i = int(np.searchsorted(self.osmids, osmid))
+        if i < self.n_nodes and self.osmids[i] == osmid:
+            return i
+        return None
+
+    def coordinates(self, nodes: Iterable[int]) -> list[tuple[float, float]]:
+        idx = np.fromiter(nodes, dtype=np.int64)
+        return list(zip(self.lat[idx].tolist(), self.lon[idx].tolist()))
+
+
+def build_road_graph(
+    osmids: Iterable[int],
+    lat: Iterable[float],
+    lon: Iterable[float],
+    u: Iterable[int],
+    v: Iterable[int],
+    weights: Iterable[float],
+    directed: bool = False,
+    travel_times: Iterable[float] | None = None,
+) -> RoadGraph:
+    """
+    build CSR graph from node and edge columns, edges are given by
+    osmids of their endpoints, edges referencing unknown nodes are dropped,
+    `directed=False` adds a reverse edge for every edge
+    """
+    node_ids = np.fromiter(osmids, dtype=np.int64)
+    node_lat = np.fromiter(lat, dtype=np.float64)
+    node_lon = np.fromiter(lon, dtype=np.float64)
+
+    order = np.argsort(node_ids, kind='stable')
+    node_ids, node_lat, node_lon = \
+        node_ids[order], node_lat[order], node_lon[order]
+    node_ids, first = np.unique(node_ids, return_index=True)
+    node_lat, node_lon = node_lat[first], node_lon[first]
+
+    edge_u = np.fromiter(u, dtype=np.int64)
+    edge_v = np.fromiter(v, dtype=np.int64)
+    edge_w = np.fromiter(weights, dtype=np.float64)
+    edge_t = None if travel_times is None else \
+        np.fromiter(travel_times, dtype=np.float64)
+
+    src = _lookup(node_ids, edge_u)
+    dst = _lookup(node_ids, edge_v)
+    keep = (src >= 0) & (dst >= 0) & np.isfinite(edge_w)
+    src, dst, edge_w = src[keep], dst[keep], edge_w[keep]
+    if edge_t is not None:
+        # segments loaded before travel times existed
+        edge_t = edge_t[keep]
+        missing = ~np.isfinite(edge_t)
+        edge_t[missing] = edge_w[missing] / (DEFAULT_SPEED / 3.6)
+
+    if not directed:
+        src, dst = np.concatenate([src, dst]), np.concatenate([dst, src])
+        edge_w = np.concatenate([edge_w, edge_w])
+        if edge_t is not None:
+            edge_t = np.concatenate([edge_t, edge_t])
+
+    order = np.argsort(src, kind='stable')
+    src, dst, edge_w = src[order], dst[order], edge_w[order]
+    if edge_t is not None:
+        edge_t = edge_t[order]
+
+    indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=len(node_ids)), out=indptr[1:])
+
+    return RoadGraph(
+        osmids=node_ids,
+        lat=node_lat,
+        lon=node_lon,
+        indptr=indptr,
+        indices=dst.astype(np.int32),
+        weights=edge_w,
+        travel_times=edge_t,
+    )
+
+
+def _lookup(sorted_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """
+    positions of `ids` in `sorted_ids`, -1 where missing
+    """
+    if not len(sorted_ids):
+        return np.full(len(ids), -1, dtype=np.int64)
+    pos = np.searchsorted(sorted_ids, ids)
+    pos[pos >= len(sorted_ids)] = 0
+    return np.where(sorted_ids[pos] == ids, pos, -1)
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def load_road_graph_from_csv() -> RoadGraph:
+    """
+    one edge per row, ways that aren't oneway have a row per direction
+    """
+    nodes = [n for n in iter_dataset('road_nodes') if n['osmid'] is not None]
+    rels = list(with_travel_time(iter_dataset('road_rels')))
+    return build_road_graph(
+        osmids=(n['osmid'] for n in nodes),
+        lat=(_to_float(n['y']) for n in nodes),
+        lon=(_to_float(n['x']) for n in nodes),
+        u=(r['u'] for r in rels),
+        v=(r['v'] for r in rels),
+        weights=(_to_float(r['length']) for r in rels),
+        directed=True,
+        travel_times=(_to_float(r['travel_time']) for r in rels),
+    )
+
+
+def load_road_graph_from_neo() -> RoadGraph:
+    from be.neo import driver
+    from be.neo import neo_query
+    nodes_query = '''
+        MATCH (i:Intersection)
+        RETURN
+            i.osmid AS osmid,
+            i.location.latitude AS lat,
+            i.location.longitude AS lon
+    '''
+    rels_query = '''
+        MATCH (u:Intersection)-[r:ROAD_SEGMENT]->(v:Intersection)
+        RETURN
+            u.osmid AS u,
+            v.osmid AS v,
+            r.length AS length,
+            r.travel_time AS travel_time
+    '''
+    with driver.session() as session:
+        nodes = neo_query(
+            session, 'road_graph_nodes', query=nodes_query, fetch='values'
+        )
+        rels = neo_query(
+            session, 'road_graph_rels', query=rels_query, fetch='values'
+        )
+    return build_road_graph(
+        osmids=(n[0] for n in nodes),
+        lat=(n[1] for n in nodes),
+        lon=(n[2] for n in nodes),
+        u=(r[0] for r in rels),
+        v=(r[1] for r in rels),
+        weights=(_to_float(r[2]) for r in rels),
+        directed=True,
+        travel_times=(_to_float(r[3]) for r in rels),
+    )
+
+
+_road_graph: RoadGraph | None = None
+_weighted_road_graphs: dict[Weight, RoadGraph] = {}
+_road_graph_lock = Lock()
+# road dataset version the loaded graph belongs to
+_road_graph_version: int | None = None
+
+
+def sync_road_graph(version: int) -> bool:
+    """
+    drop the process-wide graphs when the road data was reloaded
+    (`cli.py db load road`), they are loaded again on next use,
+    returns True if they were dropped
+    """
+    global _road_graph, _weighted_road_graphs, _road_graph_version
+    with _road_graph_lock:
+        if _road_graph_version == version:
+            return False
+        changed = _road_graph_version is not None
+        _road_graph_version = version
+        if changed:
+            _road_graph = None
+            _weighted_road_graphs = {}
+        return changed
+
+
+def get_road_graph(weight: Weight = 'length') -> RoadGraph:
+    """
+    process-wide road graph, loaded on first use from the snapshot
+    or from the source selected by `ROUTING_GRAPH_SOURCE`,
+    other weights share its arrays
+    """
+    if weight != 'length':
+        graph = _weighted_road_graphs.get(weight)
+        if graph is None:
+            graph = get_road_graph().weighted_by(weight)
+            _weighted_road_graphs[weight] = graph
+        return graph
+    global _road_graph
+    if _road_graph is None:
+        with _road_graph_lock:
+            if _road_graph is None:
+                if settings.USE_SNAPSHOT:
+                    from be.snapshot import get_snapshot
+                    _road_graph = get_snapshot().road_graph()
+                elif settings.ROUTING_GRAPH_SOURCE == 'csv':
+                    _road_graph = load_road_graph_from_csv()
+                else:
+                    _road_graph = load_road_graph_from_neo()
+    return _road_graph
@@ -0,0 +1,90 @@
+"""
+distance matrices between intersections, one shortest-path tree per source,
+the searches hold the GIL so sources are spread over a process pool
+"""
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from math import inf
+from multiprocessing import get_context
+from threading import Lock
+from be.config import settings
+from be.routing.graph import get_road_graph
+from be.routing.search import dijkstra_many
+from be.routing.weights import Weight
+
+
+def distance_matrix(
+    sources: list[int], targets: list[int], weight: Weight = 'length'
+) -> list[list[float]]:
+    """
+    road distances (or travel times) between intersection osmids,
+    inf where there is no route, sources snapped to the same intersection
+    share a search
+    """
+    unique_sources = list(dict.fromkeys(sources))
+    unique_targets = list(dict.fromkeys(targets))
+    if settings.ROUTE_MATRIX_WORKERS > 1 and len(unique_sources) > 1:
+        rows = list(get_matrix_executor().map(
+            _distance_row,
+            unique_sources,
+            repeat(unique_targets),
+            repeat(weight),
+        ))
+    else:
+        rows = [
+            _distance_row(s, unique_targets, weight) for s in unique_sources
+        ]
+
+    by_source = dict(zip(unique_sources, rows))
+    column = {t: i for i, t in enumerate(unique_targets)}
+    return [[by_source[s][column[t]] for t in targets] for s in sources]
+
+
+def _distance_row(
+    source: int, targets: list[int], weight: Weight
+) -> list[float]:
+    graph = get_road_graph(weight)
+    u = graph.node_index(source)
+    nodes = [graph.node_index(t) for t in targets]
+    if u is None:
+        return [inf] * len(targets)
+    known = [v for v in nodes if v is not None]
+    dist = dict(zip(known, dijkstra_many(graph, u, known)))
+    return [inf if v is None else dist[v] for v in nodes]
+
+
+_matrix_executor: ProcessPoolExecutor | None = None
+_matrix_executor_lock = Lock()
+
+
+def get_matrix_executor() -> ProcessPoolExecutor:
+    """
+    process-wide pool of `ROUTE_MATRIX_WORKERS` processes, every worker
+    loads its own road graph once (shared pages with `USE_SNAPSHOT`)
+    """
+    global _matrix_executor
+    if _matrix_executor is None:
+        with _matrix_executor_lock:
+            if _matrix_executor is None:
+                _matrix_executor = ProcessPoolExecutor(
+                    max_workers=settings.ROUTE_MATRIX_WORKERS,
+                    mp_context=get_context('spawn'),
+                    initializer=_load_worker_graph,
+                )
+    return _matrix_executor
+
+
+def _load_worker_graph() -> None:
+    get_road_graph().adjacency
+
+
+def shutdown_matrix_executor(wait: bool = True) -> None:
+    """
+    `wait=False` lets running matrices finish on the old workers
+    while the next one starts a new pool, e.g. when the road data changed
+    """
+    global _matrix_executor
+    with _matrix_executor_lock:
+        if _matrix_executor is not None:
+            _matrix_executor.shutdown(wait=wait, cancel_futures=wait)
+            _matrix_executor = None
@@ -0,0 +1,129 @@
+from heapq import heappush
+from heapq import heappop
+from math import inf
+from be.geo import haversine
+from be.routing.graph import RoadGraph
+
+
+# shrink the great-circle distance a bit to keep the A* heuristic admissible
+_HEURISTIC_SCALE = 0.999
+
+
+def dijkstra(
+    graph: RoadGraph, source: int, target: int
+) -> tuple[float, list[int]] | None:
+    """
+    shortest path between node indices,
+    returns (distance, node indices) or None if target is unreachable
+    """
+    return _shortest_path(graph, source, target, heuristic=None)
+
+
+def astar(
+    graph: RoadGraph, source: int, target: int
+) -> tuple[float, list[int]] | None:
+    """
+    same as `dijkstra`, guided by the haversine distance to target
+    """
+    scale = _HEURISTIC_SCALE * graph.cost_per_meter
+    heuristic = (scale * haversine(
+        graph.lat, graph.lon, graph.lat[target], graph.lon[target]
+    )).tolist()
+    return _shortest_path(graph, source, target, heuristic=heuristic)
+
+
+def _shortest_path(
+    graph: RoadGraph,
+    source: int,
+    target: int,
+    heuristic: list[float] | None,
+) -> tuple[float, list[int]] | None:
+    indptr, indices, weights = graph.adjacency
+    dist = [inf] * graph.n_nodes
+    pred = [-1] * graph.n_nodes
+    done = [False] * graph.n_nodes
+
+    dist[source] = 0.0
+    heap = [(heuristic[source] if heuristic else 0.0, source)]
+    while heap:
+        _, u = heappop(heap)
+        if done[u]:
+            continue
+        if u == target:
+            return dist[target], _unwind(pred, target)
+        done[u] = True
+        du = dist[u]
+        for e in range(indptr[u], indptr[u + 1]):
+            v = indices[e]
+            dv = du + weights[e]
+            if dv < dist[v]:
+                dist[v] = dv
+                pred[v] = u
+                heappush(heap, (dv + heuristic[v] if heuristic else dv, v))
+    return None
+
+
+def _unwind(pred: list[int], target: int) -> list[int]:
+    path = [target]
+    while pred[path[-1]] != -1:
+        path.append(pred[path[-1]])
+    path.reverse()
+    return path
+
+
+def dijkstra_many(
+    graph: RoadGraph, source: int, targets: list[int]
+) -> list[float]:
+    """
+    one-to-many search, a single shortest-path tree is grown from source
+    until every target is settled, returns distances in the order of
+    `targets`, inf where unreachable
+    """
+    indptr, indices, weights = graph.adjacency
+    dist = [inf] * graph.n_nodes
+    done = [False] * graph.n_nodes
+    remaining = set(targets)
+
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap and remaining:
+        du, u = heappop(heap)
+        if done[u]:
+            continue
+        done[u] = True
+        remaining.discard(u)
+        for e in range(indptr[u], indptr[u + 1]):
+            v = indices[e]
+            dv = du + weights[e]
+            if dv < dist[v]:
+                dist[v] = dv
+                heappush(heap, (dv, v))
+    return [dist[t] if done[t] else inf for t in targets]
+
+
+def dijkstra_bounded(
+    graph: RoadGraph, source: int, max_dist: float
+) -> tuple[list[int], list[float]]:
+    """
+    every node reachable within `max_dist` of source,
+    returns (node indices, distances) in the order they were settled
+    """
+    indptr, indices, weights = graph.adjacency
+    dist: dict[int, float] = {source: 0.0}
+    nodes: list[int] = []
+    lengths: list[float] = []
+
+    heap = [(0.0, source)]
+    while heap:
+        du, u = heappop(heap)
+        if du > dist[u]:
+            continue
+        nodes.append(u)
+        lengths.append(du)
+        for e in range(indptr[u], indptr[u + 1]):
+            v = indices[e]
+            dv = du + weights[e]
+            if dv <= max_dist and dv < dist.get(v, inf):
+                dist[v] = dv
+                heappush(heap, (dv, v))
+    return nodes, lengths
@@ -0,0 +1,56 @@
+"""
+edge weights of the road graph, `length` in meters and `travel_time`
+in seconds at the posted speed, or a default speed of the highway type
+"""
+from ast import literal_eval
+from typing import Any
+from typing import Iterable
+from typing import Iterator
+from typing import Literal
+
+
+Weight = Literal['length', 'travel_time']
+
+# km/h where a segment has no usable maxspeed
+HIGHWAY_SPEEDS: dict[str, float] = {
+    'motorway': 110.0,
+    'motorway_link': 60.0,
+    'trunk': 80.0,
+    'trunk_link': 50.0,
+    'primary': 50.0,
+    'primary_link': 40.0,
+    'secondary': 50.0,
+    'secondary_link': 40.0,
+    'tertiary': 50.0,
+    'tertiary_link': 40.0,
+    'unclassified': 40.0,
+    'residential': 30.0,
+    'living_street': 20.0,
+    'service': 20.0,
+}
+DEFAULT_SPEED = 40.0
+
+
+def segment_speed(highway: str | None, maxspeed: float | None) -> float:
+    """
+    km/h, merged ways take the highway type of their first way
+    """
+    if maxspeed:
+        return maxspeed
+    if highway and highway.startswith('['):
+        highway = literal_eval(highway)[0]
+    return HIGHWAY_SPEEDS.get(highway or '', DEFAULT_SPEED)
+
+
+def with_travel_time(
+    data: Iterable[dict[str, Any]]
+) -> Iterator[dict[str, Any]]:
+    """
+    add `speed` (km/h) and `travel_time` (s) to typed road_rels rows
+    """
+    for row in data:
+        speed = segment_speed(row['highway'], row['maxspeed'])
+        row['speed'] = speed
+        length = row['length']
+        row['travel_time'] = None if length is None else length / (speed / 3.6)
+        yield row
@@ -1,5 +1,9 @@
+from datetime import datetime
 from typing import Sequence
 from typing import Any
+from pydantic import Field
+from be.config import settings
+from be.routing.weights import Weight
 from be.schemas.base import Base
 
 
@@ -12,6 +16,42 @@ class Route(Base):
     route: Sequence[PointNode]
 
 
+class RoutePolyline(Base):
+    # Google encoded polyline of the route's lat, lon points
+    polyline: str
+    precision: int
+
+
+class IsochronePoint(Base):
+    lat: float
+    lon: float
+    distance: float
+
+
+class Isochrone(Base):
+    distance: float
+    weight: Weight
+    # intersections reached within distance, empty for shape=hull
+    points: Sequence[IsochronePoint]
+    # closed ring around the reached intersections, empty for shape=points
+    hull: Sequence[PointNode]
+
+
+class RouteMatrixQuery(Base):
+    sources: list[int]
+    destinations: list[int]
+    weight: Weight = 'length'
+
+
+class RouteMatrix(Base):
+    sources: Sequence[int]
+    destinations: Sequence[int]
+    weight: Weight
+    # meters (seconds for travel_time), rows follow sources,
+    # null where there is no route
+    distances: Sequence[Sequence[float | None]]
+
+
 class AddressOption(Base):
     value: str
     score: float
@@ -24,4 +64,45 @@ class PointOfInterest(Base):
     longitude: float
     name: str
     categories: Sequence[str]
-    tags: dict[str, Any]
\ No newline at end of file
+    tags: dict[str, Any]
+
+
+class PoiCorridorQuery(Base):
+    # meters either side of the route
+    width: float = Field(gt=0, le=settings.POI_CORRIDOR_MAX_WIDTH)
+    # a route computed before, or the addresses to route between
+    route: list[PointNode] | None = Field(
+        default=None, max_length=settings.POI_CORRIDOR_MAX_POINTS
+    )
+    source: int | None = None
+    dest: int | None = None
+    weight: Weight = 'length'
+    # labels of the POIs, any of them matches, empty matches every POI
+    categories: list[str] = []
+
+
+class PoiAlongRoute(Base):
+    poi: PointOfInterest
+    # meters from the start of the route to the point nearest to the POI
+    along: float
+    # meters from the route
+    distance: float
+
+
+class PoiNearby(Base):
+    poi: PointOfInterest
+    # meters from the searched point
+    distance: float
+
+
+class PoiIndexInfo(Base):
+    size: int
+    memory_bytes: int
+    built_at: datetime
+
+
+class CacheInfo(Base):
+    hits: int
+    misses: int
+    evictions: int
+    items: int
@@ -0,0 +1,316 @@
+"""
+read-only binary snapshot of the in-memory datasets,
+opened with mmap so every uvicorn worker shares the same pages
+
+layout: magic, header length (uint64), json header, then arrays,
+each aligned to `_ALIGNMENT` bytes at the offset listed in the header
+"""
+from datetime import datetime
+from json import dumps
+from json import loads
+from mmap import mmap
+from mmap import ACCESS_READ
+from os import replace
+from pathlib import Path
+from threading import Lock
+from typing import Any
+from typing import Sequence
+from typing import overload
+from orjson import Fragment
+import numpy as np
+from be.config import settings
+from be.poi_index import PoiIndex
+from be.routing.graph import RoadGraph
+from be.spatial import GridIndex
+
+
+SNAPSHOT_FORMAT = 5
+
+_MAGIC = b'BESNAP\x00\x01'
+_ALIGNMENT = 64
+
+
+class Snapshot:
+
+    def __init__(self, path: Path | str) -> None:
+        with open(path, 'rb') as f:
+            self._mmap = mmap(f.fileno(), 0, access=ACCESS_READ)
+        if self._mmap[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f'{path} is not a snapshot')
+        header_start = len(_MAGIC) + 8
+        header_len = int.from_bytes(
+            self._mmap[len(_MAGIC):header_start], 'little'
+        )
+        self.header: dict[str, Any] = loads(
+            self._mmap[header_start:header_start + header_len]
+        )
+        if self.header['format'] != SNAPSHOT_FORMAT:
+            raise ValueError(
+                f'snapshot format {self.header["format"]}, '
+                f'expected {SNAPSHOT_FORMAT}, rebuild it'
+            )
+        self.arrays: dict[str, np.ndarray] = {
+            name: np.frombuffer(
+                self._mmap,
+                dtype=np.dtype(meta['dtype']),
+                count=int(np.prod(meta['shape'])),
+                offset=meta['offset'],
+            ).reshape(meta['shape'])
+            for name, meta in self.header['arrays'].items()
+        }
+
+    @property
+    def created_at(self) -> datetime:
+        return datetime.fromisoformat(self.header['created_at'])
+
+    @property
+    def datasets(self) -> dict[str, int]:
+        return self.header['datasets']
+
+    def road_graph(self) -> RoadGraph:
+        return RoadGraph(
+            osmids=self.arrays['road_osmids'],
+            lat=self.arrays['road_lat'],
+            lon=self.arrays['road_lon'],
+            indptr=self.arrays['road_indptr'],
+            indices=self.arrays['road_indices'],
+            weights=self.arrays['road_weights'],
+            travel_times=self.arrays['road_travel_times'],
+        )
+
+    def poi_index(self) -> PoiIndex:
+        """
+        records, grid and label grids over the mapped arrays, as written
+        """
+        records = SnapshotRecords(
+            blob=self.arrays['poi_records'],
+            offsets=self.arrays['poi_record_offsets'],
+        )
+        return PoiIndex(
+            records=records,
+            ids=self.arrays['poi_ids'],
+            grid=GridIndex.from_arrays(
+                lat=self.arrays['poi_lat'],
+                lon=self.arrays['poi_lon'],
+                params=self.arrays['poi_grid_params'],
+                keys=self.arrays['poi_grid_keys'],
+                offsets=self.arrays['poi_grid_offsets'],
+            ),
+            label_grids=self.poi_label_grids(),
+            built_at=self.created_at,
+            records_nbytes=records.nbytes,
+        )
+
+    def poi_label_grids(self) -> dict[str, GridIndex]:
+        names = loads(self.arrays['poi_label_names'].tobytes())
+        indptr = self.arrays['poi_label_indptr'].tolist()
+        params = self.arrays['poi_label_grid_params']
+        keys = self.arrays['poi_label_grid_keys']
+        offsets = self.arrays['poi_label_grid_offsets']
+        return {
+            name: GridIndex.from_arrays(
+                lat=self.arrays['poi_lat'],
+                lon=self.arrays['poi_lon'],
+                params=params[i],
+                keys=keys[indptr[i]:indptr[i + 1]],
+                offsets=offsets[indptr[i]:indptr[i + 1]],
+            )
+            for i, name in enumerate(names)
+        }
+
+    def address_intersection(self, address_id: int) -> int | None:
+        """
+        osmid of the intersection nearest to an address
+        """
+        ids = self.arrays['address_ids']
+        i = int(np.searchsorted(ids, address_id))
+        if i == len(ids) or ids[i] != address_id:
+            return None
+        osmid = int(self.arrays['address_intersections'][i])
+        return osmid if osmid >= 0 else None
+
+
+class SnapshotRecords(Sequence[Fragment]):
+    """
+    json encoded records, spliced into responses as they are stored
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray) -> None:
+        self.blob = blob
+        self.offsets = offsets
+
+    @property
+    def nbytes(self) -> int:
+        return self.blob.nbytes + self.offsets.nbytes
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @overload
+    def __getitem__(self, i: int) -> Fragment: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> list[Fragment]: ...
+
+    def __getitem__(self, i: int | slice) -> Fragment | list[Fragment]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return Fragment(self.blob[start:end].tobytes())
+
+
+def write_snapshot(
+    path: Path | str,
+    arrays: dict[str, np.ndarray],
+    datasets: dict[str, int],
+) -> None:
+    """
+    write to a temporary file first and swap it in, workers that have
+    the previous snapshot mapped keep reading the old file
+    """
+    offset = 0
+    toc: dict[str, dict[str, Any]] = {}
+    for name, arr in arrays.items():
+        offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+        toc[name] = {
+            'dtype': arr.dtype.str,
+            'shape': list(arr.shape),
+            'offset': offset,
+        }
+        offset += arr.nbytes
+
+    header = {
+        'format': SNAPSHOT_FORMAT,
+        'created_at': datetime.utcnow().isoformat(),
+        'datasets': datasets,
+        'arrays': toc,
+    }
+    # shift offsets past the header, leaving room for the extra digits
+    encoded = dumps(header).encode('utf-8')
+    header_size = len(_MAGIC) + 8 + len(encoded) + 32 * len(toc)
+    data_start = -(-header_size // _ALIGNMENT) * _ALIGNMENT
+    for meta in toc.values():
+        meta['offset'] += data_start
+    encoded = dumps(header).encode('utf-8')
+    assert len(_MAGIC) + 8 + len(encoded) <= data_start
+
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(len(encoded).to_bytes(8, 'little'))
+        f.write(encoded)
+        for name, arr in arrays.items():
+            f.write(b'\0' * (toc[name]['offset'] - f.tell()))
+            f.write(np.ascontiguousarray(arr).tobytes())
+    replace(tmp, path)
+
+
+def build_snapshot(path: Path | str) -> dict[str, int]:
+    """
+    export road graph, POIs and addresses from Neo4j,
+    returns the number of rows per dataset
+    """
+    from be.neo import driver
+    from be.neo import neo_query
+    from be.poi_index import build_poi_index
+    from be.poi_index import load_poi_records
+    from be.routing.graph import load_road_graph_from_neo
+
+    graph = load_road_graph_from_neo()
+    poi_records, poi_ids = load_poi_records()
+    pois = build_poi_index(poi_records, poi_ids)
+
+    addresses_query = '''
+        MATCH (a:Address)
+        OPTIONAL MATCH (a)-[:NEAREST_INTERSECTION]->(i:Intersection)
+        RETURN a.id AS id, coalesce(i.osmid, -1) AS osmid
+        ORDER BY id
+    '''
+    versions_query = '''
+        MATCH (v:DatasetVersion)
+        RETURN v.name AS name, v.version AS version
+    '''
+    with driver.session() as session:
+        addresses = neo_query(
+            session,
+            'snapshot_addresses',
+            query=addresses_query,
+            fetch='values'
+        )
+        versions = {
+            r['name']: r['version']
+            for r in neo_query(
+                session, 'dataset_versions', query=versions_query
+            )
+        }
+
+    records = [p.to_json().encode('utf-8') for p in poi_records]
+    record_offsets = np.zeros(len(records) + 1, dtype=np.uint64)
+    np.cumsum([len(r) for r in records], out=record_offsets[1:])
+    # the grid of every label, keys and offsets one label after another
+    label_names = list(pois.label_grids)
+    label_grids = [pois.label_grids[name] for name in label_names]
+    label_indptr = np.zeros(len(label_names) + 1, dtype=np.uint64)
+    np.cumsum(
+        [len(grid.offsets) for grid in label_grids], out=label_indptr[1:]
+    )
+
+    arrays = {
+        'road_osmids': graph.osmids,
+        'road_lat': graph.lat,
+        'road_lon': graph.lon,
+        'road_indptr': graph.indptr,
+        'road_indices': graph.indices,
+        'road_weights': graph.weights,
+        'road_travel_times': graph.travel_times,
+        'poi_ids': pois.ids,
+        'poi_lat': pois.grid.lat,
+        'poi_lon': pois.grid.lon,
+        'poi_grid_params': pois.grid.params,
+        'poi_grid_keys': pois.grid.keys.astype(np.int64),
+        'poi_grid_offsets': pois.grid.offsets.astype(np.int64),
+        'poi_records': np.frombuffer(b''.join(records), dtype=np.uint8),
+        'poi_record_offsets': record_offsets,
+        'poi_label_names':
+            np.frombuffer(dumps(label_names).encode('utf-8'), dtype=np.uint8),
+        'poi_label_indptr': label_indptr,
+        'poi_label_grid_params': np.array(
+            [grid.params for grid in label_grids], dtype=np.float64
+        ).reshape(-1, 5),
+        'poi_label_grid_keys': np.concatenate(
+            [grid.keys for grid in label_grids]
+            or [np.empty(0, dtype=np.int64)]
+        ).astype(np.int64),
+        'poi_label_grid_offsets': np.concatenate(
+            [grid.offsets for grid in label_grids]
+            or [np.empty(0, dtype=np.int64)]
+        ).astype(np.int64),
+        'address_ids': np.array([a[0] for a in addresses], dtype=np.int64),
+        'address_intersections':
+            np.array([a[1] for a in addresses], dtype=np.int64),
+    }
+    write_snapshot(path=path, arrays=arrays, datasets=versions)
+    return {
+        'road_nodes': graph.n_nodes,
+        'road_edges': graph.n_edges,
+        'poi': len(records),
+        'address': len(addresses),
+    }
+
+
+_snapshot: Snapshot | None = None
+_snapshot_lock = Lock()
+
+
+def get_snapshot(reload: bool = False) -> Snapshot:
+    """
+    process-wide snapshot mapped from `DATA_DIR/SNAPSHOT_FILENAME`
+    """
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None or reload:
+            _snapshot = Snapshot(
+                settings.DATA_DIR.joinpath(settings.SNAPSHOT_FILENAME)
+            )
+        return _snapshot
@@ -0,0 +1,204 @@
+from dataclasses import dataclass
+import numpy as np
+from be.geo import EARTH_RADIUS_M
+from be.geo import haversine
+
+
+@dataclass
+class GridIndex:
+    """
+    uniform grid over point coordinates, `offsets` are positions in the
+    indexed arrays sorted by the key of the cell they fall into,
+    `keys` holds the cell key at the same positions
+    """
+
+    lat: np.ndarray
+    lon: np.ndarray
+    lat_origin: float
+    lon_origin: float
+    cell_lat: float
+    cell_lon: float
+    n_cols: int
+    keys: np.ndarray
+    offsets: np.ndarray
+
+    @classmethod
+    def from_arrays(
+        cls,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        params: np.ndarray,
+        keys: np.ndarray,
+        offsets: np.ndarray,
+    ) -> 'GridIndex':
+        """
+        grid over arrays written before, e.g. mapped from a snapshot,
+        nothing is sorted or copied
+        """
+        lat_origin, lon_origin, cell_lat, cell_lon, n_cols = params.tolist()
+        return cls(
+            lat=lat,
+            lon=lon,
+            lat_origin=lat_origin,
+            lon_origin=lon_origin,
+            cell_lat=cell_lat,
+            cell_lon=cell_lon,
+            n_cols=int(n_cols),
+            keys=keys,
+            offsets=offsets,
+        )
+
+    @property
+    def params(self) -> np.ndarray:
+        """
+        cell parameters, with `keys` and `offsets` all `from_arrays` needs
+        """
+        return np.array([
+            self.lat_origin,
+            self.lon_origin,
+            self.cell_lat,
+            self.cell_lon,
+            self.n_cols,
+        ], dtype=np.float64)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            arr.nbytes for arr in (self.lat, self.lon, self.keys, self.offsets)
+        )
+
+    def within_bbox(
+        self,
+        lat_min: float,
+        lat_max: float,
+        lon_min: float,
+        lon_max: float,
+    ) -> np.ndarray:
+        """
+        offsets of points within the bbox (inclusive)
+        """
+        if not len(self.offsets) or lat_min > lat_max or lon_min > lon_max:
+            return np.empty(0, dtype=np.int64)
+        n_rows = int(self.keys[-1] // self.n_cols) + 1
+        r0, r1 = self._cells(lat_min, lat_max, self.lat_origin, self.cell_lat)
+        c0, c1 = self._cells(lon_min, lon_max, self.lon_origin, self.cell_lon)
+        r0, r1 = max(r0, 0), min(r1, n_rows - 1)
+        c0, c1 = max(c0, 0), min(c1, self.n_cols - 1)
+        if r0 > r1 or c0 > c1:
+            return np.empty(0, dtype=np.int64)
+
+        # cells of one grid row are contiguous in key order
+        rows = np.arange(r0, r1 + 1, dtype=np.int64) * self.n_cols
+        starts = np.searchsorted(self.keys, rows + c0, side='left')
+        ends = np.searchsorted(self.keys, rows + c1, side='right')
+        candidates = self.offsets[_ranges(starts, ends)]
+
+        lat, lon = self.lat[candidates], self.lon[candidates]
+        mask = (lat >= lat_min) & (lat <= lat_max) & \
+            (lon >= lon_min) & (lon <= lon_max)
+        return candidates[mask]
+
+    def within_radius(
+        self, lat: float, lon: float, radius: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        offsets of points closer than `radius` meters and their distances
+        """
+        d_lat = np.degrees(radius / EARTH_RADIUS_M)
+        d_lon = d_lat / max(np.cos(np.radians(min(abs(lat) + d_lat, 89.9))), 1e-9)
+        candidates = self.within_bbox(
+            lat - d_lat, lat + d_lat, lon - d_lon, lon + d_lon
+        )
+        dist = haversine(lat, lon, self.lat[candidates], self.lon[candidates])
+        mask = dist < radius
+        return candidates[mask], dist[mask]
+
+    def nearest(
+        self, lat: float, lon: float, k: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        offsets of the `k` nearest points ordered by their distance and
+        the distances, the search radius starts at one cell and doubles
+        until it holds `k` points or the whole grid
+        """
+        if not len(self.offsets) or k < 1:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        n_rows = int(self.keys[-1] // self.n_cols) + 1
+        corners_lat = self.lat_origin + np.array([0, 0, 1, 1]) * \
+            n_rows * self.cell_lat
+        corners_lon = self.lon_origin + np.array([0, 1, 0, 1]) * \
+            self.n_cols * self.cell_lon
+        # every point of the grid is closer than its farthest corner
+        max_radius = float(haversine(lat, lon, corners_lat, corners_lon).max())
+        radius = float(np.radians(self.cell_lat)) * EARTH_RADIUS_M
+        while True:
+            offsets, dist = self.within_radius(lat, lon, radius)
+            if len(offsets) >= k or radius > max_radius:
+                break
+            radius *= 2
+        order = np.lexsort((offsets, dist))[:k]
+        return offsets[order], dist[order]
+
+    @staticmethod
+    def _cells(
+        v_min: float, v_max: float, origin: float, size: float
+    ) -> tuple[int, int]:
+        return (
+            int(np.floor((v_min - origin) / size)),
+            int(np.floor((v_max - origin) / size)),
+        )
+
+
+def build_grid_index(
+    lat: np.ndarray,
+    lon: np.ndarray,
+    cell_size: float = 250.0,
+    subset: np.ndarray | None = None,
+) -> GridIndex:
+    """
+    grid with cells of roughly `cell_size` meters over the points at the
+    `subset` offsets (all points by default), its offsets index `lat`, `lon`
+    either way, so grids over subsets share the coordinate arrays
+    """
+    lat = np.ascontiguousarray(lat, dtype=np.float64)
+    lon = np.ascontiguousarray(lon, dtype=np.float64)
+    points = np.arange(len(lat), dtype=np.int64) if subset is None \
+        else np.asarray(subset, dtype=np.int64)
+    points_lat, points_lon = lat[points], lon[points]
+    if len(points):
+        lat_origin = float(points_lat.min())
+        lon_origin = float(points_lon.min())
+        lat_mid = float(points_lat.mean())
+    else:
+        lat_origin = lon_origin = lat_mid = 0.0
+    cell_lat = float(np.degrees(cell_size / EARTH_RADIUS_M))
+    cell_lon = cell_lat / float(np.cos(np.radians(lat_mid)))
+
+    rows = np.floor((points_lat - lat_origin) / cell_lat).astype(np.int64)
+    cols = np.floor((points_lon - lon_origin) / cell_lon).astype(np.int64)
+    n_cols = int(cols.max()) + 1 if len(cols) else 1
+    keys = rows * n_cols + cols
+    order = np.argsort(keys, kind='stable')
+    return GridIndex(
+        lat=lat,
+        lon=lon,
+        lat_origin=lat_origin,
+        lon_origin=lon_origin,
+        cell_lat=cell_lat,
+        cell_lon=cell_lon,
+        n_cols=n_cols,
+        keys=keys[order],
+        offsets=points[order],
+    )
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    concatenation of arange(start, end) for every pair, vectorized
+    """
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return np.arange(total, dtype=np.int64) + shifts
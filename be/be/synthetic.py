@@ -0,0 +1,196 @@
+"""
+synthetic OSM datasets with the same columns and format (`DS_FORMAT`)
+as the files written by `be.osm`, for benchmarks without network access
+"""
+from pathlib import Path
+from typing import Any
+from typing import Iterator
+import numpy as np
+from be.geo import haversine
+from be.utils import DATASET_COLUMNS
+from be.utils import dataset_path
+from be.utils import write_dataset
+
+
+# roughly the size of the Prague datasets at scale 1
+_PRG_ROAD_NODES = 25_000
+_PRG_ADDRESSES = 95_000
+_PRG_POIS = 60_000
+
+_PRG_LAT_MIN, _PRG_LAT_MAX = 49.94, 50.18
+_PRG_LON_MIN, _PRG_LON_MAX = 14.22, 14.71
+
+_HIGHWAYS = ['residential', 'tertiary', 'secondary', 'primary', 'unclassified']
+_MAXSPEEDS = ['30', '50', '50', '70', '']
+_POI_CLASSES = {
+    'amenity': ['restaurant', 'cafe', 'pharmacy', 'bank', 'fuel'],
+    'shop': ['supermarket', 'bakery', 'clothes', 'convenience'],
+    'tourism': ['hotel', 'museum', 'attraction'],
+    'leisure': ['park', 'playground', 'sports_centre'],
+}
+
+
+def generate_synthetic_data(
+    out_dir: Path | str, scale: float = 1.0, seed: int = 0
+) -> dict[str, int]:
+    """
+    write road nodes, road relationships, addresses and POIs for
+    `scale` times Prague into `out_dir`, returns row counts per file
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    # larger scales grow the area, keeping the density of Prague
+    side = np.sqrt(scale)
+    lat_max = _PRG_LAT_MIN + (_PRG_LAT_MAX - _PRG_LAT_MIN) * side
+    lon_max = _PRG_LON_MIN + (_PRG_LON_MAX - _PRG_LON_MIN) * side
+    bbox = (_PRG_LAT_MIN, lat_max, _PRG_LON_MIN, lon_max)
+
+    counts = _write_roads(out_dir, rng, bbox, int(_PRG_ROAD_NODES * scale))
+    counts[dataset_path('address', out_dir).name] = _write_addresses(
+        out_dir, rng, bbox, int(_PRG_ADDRESSES * scale)
+    )
+    counts[dataset_path('poi', out_dir).name] = _write_pois(
+        out_dir, rng, bbox, int(_PRG_POIS * scale)
+    )
+    return counts
+
+
+def _write_roads(
+    out_dir: Path,
+    rng: np.random.Generator,
+    bbox: tuple[float, float, float, float],
+    n: int,
+) -> dict[str, int]:
+    """
+    jittered grid of intersections, each connected to its right
+    and lower neighbour in both directions unless the segment is oneway
+    """
+    n_cols = max(int(np.sqrt(n)), 2)
+    n_rows = max(n // n_cols, 2)
+    n = n_rows * n_cols
+    lat_step = (bbox[1] - bbox[0]) / n_rows
+    lon_step = (bbox[3] - bbox[2]) / n_cols
+    rows, cols = np.divmod(np.arange(n), n_cols)
+    lat = bbox[0] + (rows + rng.uniform(0.1, 0.9, n)) * lat_step
+    lon = bbox[2] + (cols + rng.uniform(0.1, 0.9, n)) * lon_step
+    osmids = 10_000_000 + np.cumsum(rng.integers(1, 50, n))
+
+    nodes_path = dataset_path('road_nodes', out_dir)
+    write_dataset(
+        path=nodes_path,
+        columns=DATASET_COLUMNS['road_nodes'],
+        rows=(
+            {'osmid': osmids[i], 'y': lat[i], 'x': lon[i], 'street_count': 4}
+            for i in range(n)
+        )
+    )
+
+    right = np.arange(n)[cols < n_cols - 1]
+    down = np.arange(n)[rows < n_rows - 1]
+    u = np.concatenate([right, down])
+    v = np.concatenate([right + 1, down + n_cols])
+    keep = rng.random(len(u)) > 0.15
+    u, v = u[keep], v[keep]
+    oneway = rng.random(len(u)) < 0.2
+    length = haversine(lat[u], lon[u], lat[v], lon[v]) * \
+        rng.uniform(1, 1.3, len(u))
+    highway = rng.integers(0, len(_HIGHWAYS), len(u))
+    maxspeed = rng.integers(0, len(_MAXSPEEDS), len(u))
+    lanes = rng.integers(1, 4, len(u))
+    way_ids = 100_000_000 + np.arange(len(u))
+
+    def iter_rels() -> Iterator[dict[str, Any]]:
+        for e in range(len(u)):
+            directions = [(u[e], v[e], False)]
+            if not oneway[e]:
+                directions.append((v[e], u[e], True))
+            for a, b, reversed_ in directions:
+                yield {
+                    'u': osmids[a],
+                    'v': osmids[b],
+                    'key': 0,
+                    'osmid': way_ids[e],
+                    'oneway': bool(oneway[e]),
+                    'lanes': lanes[e],
+                    'name': f'Street {way_ids[e] % 5000}',
+                    'highway': _HIGHWAYS[highway[e]],
+                    'maxspeed': _MAXSPEEDS[maxspeed[e]],
+                    'reversed': reversed_,
+                    'length': round(float(length[e]), 3),
+                }
+
+    rels_path = dataset_path('road_rels', out_dir)
+    n_rels = write_dataset(
+        path=rels_path, columns=DATASET_COLUMNS['road_rels'], rows=iter_rels()
+    )
+    return {nodes_path.name: n, rels_path.name: n_rels}
+
+
+def _write_addresses(
+    out_dir: Path,
+    rng: np.random.Generator,
+    bbox: tuple[float, float, float, float],
+    n: int,
+) -> int:
+    lat = rng.uniform(bbox[0], bbox[1], n)
+    lon = rng.uniform(bbox[2], bbox[3], n)
+    return write_dataset(
+        path=dataset_path('address', out_dir),
+        columns=DATASET_COLUMNS['address'],
+        rows=(
+            {
+                'type': 'node',
+                'id': 200_000_000 + i,
+                'lat': lat[i],
+                'lon': lon[i],
+                'tags': {
+                    'addr_city': 'Praha',
+                    'addr_conscriptionnumber': str(1000 + i % 9000),
+                    'addr_housenumber': str(1 + i % 120),
+                    'addr_postcode': str(10000 + i % 9000),
+                    'addr_street': f'Street {i % 5000}',
+                    'addr_streetnumber': str(1 + i % 120),
+                },
+            }
+            for i in range(n)
+        )
+    )
+
+
+def _write_pois(
+    out_dir: Path,
+    rng: np.random.Generator,
+    bbox: tuple[float, float, float, float],
+    n: int,
+) -> int:
+    lat = rng.uniform(bbox[0], bbox[1], n)
+    lon = rng.uniform(bbox[2], bbox[3], n)
+    classes = list(_POI_CLASSES)
+    cls_idx = rng.integers(0, len(classes), n)
+
+    def iter_pois() -> Iterator[dict[str, Any]]:
+        for i in range(n):
+            cls = classes[cls_idx[i]]
+            subclass = _POI_CLASSES[cls][i % len(_POI_CLASSES[cls])]
+            name = f'{subclass.title()} {i}'
+            tags = {cls: subclass, 'name': name}
+            if i % 3 == 0:
+                tags['opening_hours'] = 'Mo-Fr 08:00-18:00'
+            if i % 4 == 0:
+                tags['website'] = f'https://example.com/{i}'
+            yield {
+                'id': 300_000_000 + i,
+                'lat': lat[i],
+                'lon': lon[i],
+                'tags': tags,
+                'name': name,
+                'class': cls,
+                'subclass': subclass,
+            }
+
+    return write_dataset(
+        path=dataset_path('poi', out_dir),
+        columns=DATASET_COLUMNS['poi'],
+        rows=iter_pois()
+    )
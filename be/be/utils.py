@@ -1,16 +1,317 @@
 from csv import DictReader
+from csv import writer
+from math import isnan
+from os import replace
 from pathlib import Path
 from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import Literal
+from typing import TypeVar
 from ast import literal_eval
+from hashlib import blake2b
+from json import dumps
+from json import loads
+from itertools import islice
+from queue import Queue
+from queue import Full
+from threading import Event
+from threading import Thread
+from be.config import settings
+
+
+T = TypeVar('T')
+
+Dataset = Literal['road_nodes', 'road_rels', 'address', 'poi']
 
 
 def get_osm_csv_records(path: Path | str) -> list[dict[str, Any]]:
-    records: list[dict[str, Any]] = []
+    return list(iter_osm_csv_records(path=path))
+
+
+def iter_osm_csv_records(path: Path | str) -> Iterator[dict[str, Any]]:
+    """
+    lazy version of `get_osm_csv_records`, yields one row at a time
+    """
     with open(path, encoding='utf-8') as f:
         reader = DictReader(f)
         for row in reader:
             if 'tags' in row:
                 tags = literal_eval(row['tags'])
                 row['tags'] = tags
-            records.append(row)
-    return records
\ No newline at end of file
+            yield row
+
+
+def content_hash(row: dict[str, Any]) -> str:
+    """
+    hash of a record independent of the order of its fields and tags
+    """
+    encoded = dumps(row, sort_keys=True, default=str).encode('utf-8')
+    return blake2b(encoded, digest_size=16).hexdigest()
+
+
+def with_content_hash(
+    data: Iterable[dict[str, Any]]
+) -> Iterator[dict[str, Any]]:
+    for row in data:
+        row['content_hash'] = content_hash(row)
+        yield row
+
+
+def as_int(value: Any) -> int | None:
+    if value is None or value == '' or isinstance(value, (list, bool)):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def as_float(value: Any) -> float | None:
+    if value is None or value == '':
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if isnan(value) else value
+
+
+def as_bool(value: Any) -> bool | None:
+    if isinstance(value, bool):
+        return value
+    return {'True': True, 'False': False}.get(str(value))
+
+
+def as_str(value: Any) -> str | None:
+    if value is None or value == '' or \
+            isinstance(value, float) and isnan(value):
+        return None
+    return str(value)
+
+
+def as_tags(value: Any) -> dict[str, Any]:
+    if isinstance(value, dict):
+        return value
+    return literal_eval(value) if value else {}
+
+
+# implicit limits in km/h used in place of a number
+_SPEED_ZONES = {
+    'CZ:urban': 50.0,
+    'CZ:rural': 90.0,
+    'CZ:trunk': 110.0,
+    'CZ:motorway': 130.0,
+    'CZ:living_street': 20.0,
+    'walk': 6.0,
+}
+
+
+def as_lanes(value: Any) -> int | None:
+    """
+    number of lanes, the lowest one of merged ways or `;` separated values
+    """
+    lanes = [as_int(v) for v in _as_values(value)]
+    return min((x for x in lanes if x is not None), default=None)
+
+
+def as_speed(value: Any) -> float | None:
+    """
+    maxspeed in km/h, the lowest one of merged ways or `;` separated values,
+    mph values are converted, 'none' and unknown values are missing
+    """
+    speeds = [_parse_speed(v) for v in _as_values(value)]
+    return min((x for x in speeds if x is not None), default=None)
+
+
+def _as_values(value: Any) -> list[Any]:
+    """
+    osmnx keeps the values of merged ways as a list (repr-encoded in csv)
+    """
+    if isinstance(value, list):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return [] if isinstance(value, float) and isnan(value) else [value]
+    text = as_str(value)
+    if text is None:
+        return []
+    if text.startswith('['):
+        return literal_eval(text)
+    return text.split(';')
+
+
+def _parse_speed(value: Any) -> float | None:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return as_float(value)
+    text = str(value).strip()
+    if text in _SPEED_ZONES:
+        return _SPEED_ZONES[text]
+    if text.endswith('mph'):
+        mph = as_float(text[:-3].strip())
+        return None if mph is None else mph * 1.609344
+    return as_float(text)
+
+
+# column -> type of every dataset, merged ways have a list in place of
+# a single osmid (and `reversed`), those are typed as missing
+DATASET_COLUMNS: dict[Dataset, dict[str, Callable[[Any], Any]]] = {
+    'road_nodes': {
+        'osmid': as_int,
+        'y': as_float,
+        'x': as_float,
+        'street_count': as_int,
+        'highway': as_str,
+        'ref': as_str,
+    },
+    'road_rels': {
+        'u': as_int,
+        'v': as_int,
+        'key': as_int,
+        'osmid': as_int,
+        'oneway': as_bool,
+        'lanes': as_lanes,
+        'ref': as_str,
+        'name': as_str,
+        'highway': as_str,
+        'maxspeed': as_speed,
+        'reversed': as_bool,
+        'length': as_float,
+    },
+    'address': {
+        'type': as_str,
+        'id': as_int,
+        'lat': as_float,
+        'lon': as_float,
+        'tags': as_tags,
+    },
+    'poi': {
+        'id': as_int,
+        'lat': as_float,
+        'lon': as_float,
+        'tags': as_tags,
+        'name': as_str,
+        'class': as_str,
+        'subclass': as_str,
+    },
+}
+
+_DATASET_FILENAMES: dict[Dataset, str] = {
+    'road_nodes': 'DS_ROAD_PRG_NODES_FILENAME',
+    'road_rels': 'DS_ROAD_PRG_RELS_FILENAME',
+    'address': 'DS_ADDRESS_PRG_NODES_FILENAME',
+    'poi': 'DS_POI_PRG_NODES_FILENAME',
+}
+
+
+def dataset_path(dataset: Dataset, data_dir: Path | None = None) -> Path:
+    """
+    file of a dataset in `DS_FORMAT`, json lines use the `.jsonl` suffix
+    """
+    filename = getattr(settings, _DATASET_FILENAMES[dataset])
+    path = (data_dir or settings.DATA_DIR).joinpath(filename)
+    if settings.DS_FORMAT == 'jsonl':
+        return path.with_suffix('.jsonl')
+    return path
+
+
+def iter_dataset(dataset: Dataset) -> Iterator[dict[str, Any]]:
+    return iter_dataset_records(
+        path=dataset_path(dataset), columns=DATASET_COLUMNS[dataset]
+    )
+
+
+def iter_dataset_records(
+    path: Path | str, columns: dict[str, Callable[[Any], Any]]
+) -> Iterator[dict[str, Any]]:
+    """
+    typed rows of a dataset, json lines are typed already,
+    csv values are converted by `columns` (other columns stay strings)
+    """
+    path = Path(path)
+    with open(path, encoding='utf-8') as f:
+        if path.suffix == '.jsonl':
+            for line in f:
+                yield loads(line)
+            return
+        for row in DictReader(f):
+            yield {
+                k: columns[k](v) if k in columns else v for k, v in row.items()
+            }
+
+
+def write_dataset(
+    path: Path | str,
+    columns: dict[str, Callable[[Any], Any]],
+    rows: Iterable[dict[str, Any]],
+) -> int:
+    """
+    write rows converted to the `columns` types as json lines (`.jsonl`)
+    or csv with repr-encoded tags, the file is replaced once complete,
+    returns the number of rows
+    """
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    count = 0
+    with open(tmp, 'w', encoding='utf-8', newline='') as f:
+        w = writer(f)
+        if path.suffix != '.jsonl':
+            w.writerow(columns)
+        for row in rows:
+            typed = {k: as_type(row.get(k)) for k, as_type in columns.items()}
+            if path.suffix == '.jsonl':
+                f.write(dumps(typed, ensure_ascii=False))
+                f.write('\n')
+            else:
+                w.writerow('' if v is None else v for v in typed.values())
+            count += 1
+    replace(tmp, path)
+    return count
+
+
+def iter_batches(data: Iterable[T], batch_size: int) -> Iterator[list[T]]:
+    it = iter(data)
+    while batch := list(islice(it, batch_size)):
+        yield batch
+
+
+def prefetch(data: Iterable[T], size: int = 1) -> Iterator[T]:
+    """
+    consume `data` in a background thread, keeping at most `size` items
+    ready ahead of the caller, so producing the next item overlaps with
+    processing the current one
+    """
+    queue: Queue[tuple[Any, BaseException | None]] = Queue(maxsize=size)
+    stop = Event()
+    end = object()
+
+    def put(item: Any, error: BaseException | None = None) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put((item, error), timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in data:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(end, e)
+            return
+        put(end)
+
+    Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, error = queue.get()
+            if error is not None:
+                raise error
+            if item is end:
+                return
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,26 @@
+from time import monotonic
+from neo4j import AsyncSession
+from be.config import settings
+from be.neo import neo_query_async
+
+
+_versions: dict[str, int] = {}
+_fetched_at: float | None = None
+
+
+async def get_dataset_version(session: AsyncSession, name: str) -> int:
+    """
+    version of a dataset as bumped by `cli.py db load`, 0 if never loaded,
+    versions are re-read from Neo4j at most every `DATASET_VERSION_TTL` seconds
+    """
+    global _versions, _fetched_at
+    if _fetched_at is None or \
+            monotonic() - _fetched_at > settings.DATASET_VERSION_TTL:
+        query = '''
+            MATCH (v:DatasetVersion)
+            RETURN v.name AS name, v.version AS version
+        '''
+        data = await neo_query_async(session, 'dataset_versions', query)
+        _versions = {r['name']: r['version'] for r in data}
+        _fetched_at = monotonic()
+    return _versions.get(name, 0)
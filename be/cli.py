@@ -1,5 +1,6 @@
 from argparse import ArgumentParser
 from argparse import Namespace
+from pathlib import Path
 from be.osm import download_prague_poi_data
 from be.osm import download_prague_address_data
 from be.osm import download_prague_road_data
@@ -9,8 +10,14 @@ from be.neo import load_prague_road_nodes
 from be.neo import load_prague_road_rels
 from be.neo import create_prague_road_indexes
 from be.neo import create_prague_address_road_rels
+from be.neo import create_prague_address_road_rels_kdtree
 from be.neo import create_prague_poi_address_fulltext_index
+from be.neo import create_prague_poi_indexes
 from be.neo import neo_clean_db
+from be.neo import bump_dataset_version
+from be.neo import migrate_prague_poi_compact
+from be.config import settings
+from be.metrics import write_metrics
 
 
 def main():
@@ -18,6 +25,10 @@ def main():
         prog='cli',
         description='execute commands'
     )
+    parser.add_argument(
+        '--metrics',
+        help='write request and query metrics in Prometheus text format here'
+    )
     subparsers = parser.add_subparsers(title='commands')
 
     parser_download = subparsers.add_parser('download')
@@ -28,34 +39,246 @@ def main():
 
     parser_db_load = subparsers_db.add_parser('load')
     parser_db_load.add_argument('dataset', choices=['poi', 'road', 'address'])
+    parser_db_load.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='number of parallel sessions used to load poi and road data'
+    )
+    parser_db_load.add_argument(
+        '--snap',
+        choices=['neo', 'kdtree'],
+        default='neo',
+        help='how addresses are snapped to their nearest intersection'
+    )
+    parser_db_load.add_argument(
+        '--incremental',
+        action='store_true',
+        help='only write rows whose content hash changed, delete removed ones'
+    )
     parser_db_load.set_defaults(func=load_data)
 
+    parser_db_import = subparsers_db.add_parser('import')
+    parser_db_import.add_argument(
+        '--offline',
+        action='store_true',
+        help='write neo4j-admin import files, the database must be stopped'
+    )
+    parser_db_import.add_argument(
+        '--out', default=str(settings.DATA_DIR.joinpath('import'))
+    )
+    parser_db_import.add_argument(
+        '--run',
+        action='store_true',
+        help='run neo4j-admin once the files are written'
+    )
+    parser_db_import.set_defaults(func=import_data)
+
+    parser_db_index = subparsers_db.add_parser('index')
+    parser_db_index.set_defaults(func=create_indexes)
+
     parser_db_load = subparsers_db.add_parser('clean')
     parser_db_load.set_defaults(func=clean_db)
 
+    parser_db_migrate_poi = subparsers_db.add_parser('migrate-poi')
+    parser_db_migrate_poi.set_defaults(func=migrate_poi)
+
+    parser_db_build_ch = subparsers_db.add_parser('build-ch')
+    parser_db_build_ch.set_defaults(func=build_ch)
+
+    parser_snapshot = subparsers.add_parser('snapshot')
+    subparsers_snapshot = parser_snapshot.add_subparsers(
+        title='snapshot commands'
+    )
+
+    parser_snapshot_build = subparsers_snapshot.add_parser('build')
+    parser_snapshot_build.add_argument(
+        '--out',
+        default=str(settings.DATA_DIR.joinpath(settings.SNAPSHOT_FILENAME))
+    )
+    parser_snapshot_build.set_defaults(func=build_snapshot)
+
+    parser_bench = subparsers.add_parser('bench')
+    subparsers_bench = parser_bench.add_subparsers(title='bench commands')
+
+    parser_bench_generate = subparsers_bench.add_parser('generate')
+    parser_bench_generate.add_argument(
+        '--scale', type=float, default=1.0, help='size relative to Prague'
+    )
+    parser_bench_generate.add_argument(
+        '--out', default=str(settings.DATA_DIR.joinpath('synthetic'))
+    )
+    parser_bench_generate.add_argument('--seed', type=int, default=0)
+    parser_bench_generate.set_defaults(func=generate_bench_data)
+
+    parser_bench_run = subparsers_bench.add_parser('run')
+    parser_bench_run.add_argument(
+        '--data', default=str(settings.DATA_DIR.joinpath('synthetic'))
+    )
+    parser_bench_run.add_argument(
+        '--driver',
+        choices=['memory', 'neo'],
+        default='memory',
+        help='"neo" writes into NEO_DATABASE, use a scratch database'
+    )
+    parser_bench_run.add_argument('--batch-size', type=int, default=10000)
+    parser_bench_run.add_argument(
+        '--dataset',
+        action='append',
+        choices=['road_nodes', 'road_rels', 'address', 'poi']
+    )
+    parser_bench_run.add_argument('--out', help='json report path')
+    parser_bench_run.set_defaults(func=run_bench)
+
+    parser_bench_serialize = subparsers_bench.add_parser('serialize')
+    parser_bench_serialize.add_argument(
+        '--data', default=str(settings.DATA_DIR.joinpath('synthetic'))
+    )
+    parser_bench_serialize.add_argument(
+        '--rows', type=int, help='POIs per response, all by default'
+    )
+    parser_bench_serialize.set_defaults(func=run_serialization_bench)
+
     args = parser.parse_args()
     if hasattr(args, 'func'):
         args.func(args=args)
+    if args.metrics:
+        write_metrics(args.metrics)
 
 
 def clean_db(*args, **kwargs) -> None:
     neo_clean_db()
 
 
+def migrate_poi(*args, **kwargs) -> None:
+    print('Migrating Prague POIs to compact schema')
+    migrate_prague_poi_compact()
+    bump_dataset_version('poi')
+
+
+def build_ch(*args, **kwargs) -> None:
+    from time import perf_counter
+    from be.routing.graph import get_road_graph
+    from be.routing.ch import build_contraction_hierarchy
+    from be.routing.ch import save_contraction_hierarchy
+    print('Loading road graph')
+    graph = get_road_graph()
+    print(f'Contracting {graph.n_nodes} nodes, {graph.n_edges} edges')
+    start = perf_counter()
+    ch = build_contraction_hierarchy(graph)
+    print(
+        f'Added {ch.n_shortcuts} shortcuts in {perf_counter() - start:.1f}s'
+    )
+    save_contraction_hierarchy(
+        ch, settings.DATA_DIR.joinpath(settings.DS_ROAD_PRG_CH_FILENAME)
+    )
+
+
 def load_data(args: Namespace, **kwargs) -> None:
     if args.dataset == 'poi':
         print('Loading Prague POIs')
-        load_prague_poi()
+        load_prague_poi(workers=args.workers, incremental=args.incremental)
     if args.dataset == 'address':
         print('Loading Prague addresses')
-        load_prague_address_nodes()
-        create_prague_address_road_rels()
+        load_prague_address_nodes(incremental=args.incremental)
+        snap_addresses(args.snap)
         create_prague_poi_address_fulltext_index()
     if args.dataset == 'road':
         print('Loading Prague roads')
         create_prague_road_indexes()
-        load_prague_road_nodes()
-        load_prague_road_rels()
+        load_prague_road_nodes(
+            workers=args.workers, incremental=args.incremental
+        )
+        load_prague_road_rels(
+            workers=args.workers, incremental=args.incremental
+        )
+        if args.incremental:
+            # addresses near changed intersections were unlinked
+            snap_addresses(args.snap)
+    bump_dataset_version(args.dataset)
+
+
+def snap_addresses(snap: str) -> None:
+    if snap == 'kdtree':
+        create_prague_address_road_rels_kdtree()
+    else:
+        create_prague_address_road_rels()
+
+
+def import_data(args: Namespace, **kwargs) -> None:
+    from shlex import join
+    from subprocess import run
+    from time import perf_counter
+    from be.offline_import import write_import_files
+    if not args.offline:
+        print(
+            'Only offline import is supported, '
+            'stop the database and pass --offline'
+        )
+        return
+    print(f'Writing import files into {args.out}')
+    start = perf_counter()
+    files = write_import_files(out_dir=args.out)
+    for name, rows in files.rows.items():
+        print(f'{name}: {rows} rows')
+    print(f'Done in {perf_counter() - start:.1f}s')
+    command = files.command(database=settings.NEO_DATABASE)
+    if args.run:
+        run(command, check=True)
+    else:
+        print(join(command))
+    print('Start the database and run "python cli.py db index"')
+
+
+def create_indexes(*args, **kwargs) -> None:
+    from be.offline_import import expand_imported_tags
+    print('Expanding imported tags')
+    expand_imported_tags()
+    print('Creating indexes')
+    create_prague_road_indexes()
+    create_prague_poi_address_fulltext_index()
+    if settings.POI_SCHEMA == 'compact':
+        create_prague_poi_indexes()
+    for dataset in ('poi', 'road', 'address'):
+        bump_dataset_version(dataset)
+
+
+def build_snapshot(args: Namespace, **kwargs) -> None:
+    from be.snapshot import build_snapshot as build
+    print(f'Building snapshot {args.out}')
+    for dataset, rows in build(path=args.out).items():
+        print(f'{dataset}: {rows}')
+
+
+def generate_bench_data(args: Namespace, **kwargs) -> None:
+    from be.synthetic import generate_synthetic_data
+    print(f'Generating {args.scale}x Prague into {args.out}')
+    counts = generate_synthetic_data(
+        out_dir=args.out, scale=args.scale, seed=args.seed
+    )
+    for filename, rows in counts.items():
+        print(f'{filename}: {rows} rows')
+
+
+def run_bench(args: Namespace, **kwargs) -> None:
+    from json import dumps
+    from be.bench import run_benchmarks
+    report = run_benchmarks(
+        data_dir=args.data,
+        driver=args.driver,
+        batch_size=args.batch_size,
+        datasets=args.dataset,
+    )
+    if args.out:
+        Path(args.out).write_text(dumps(report, indent=2), encoding='utf-8')
+    print(dumps(report, indent=2))
+
+
+def run_serialization_bench(args: Namespace, **kwargs) -> None:
+    from json import dumps
+    from be.bench import run_serialization_benchmark
+    report = run_serialization_benchmark(data_dir=args.data, rows=args.rows)
+    print(dumps(report, indent=2))
 
 
 def download_data(*args, **kwargs) -> None:
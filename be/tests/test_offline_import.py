@@ -0,0 +1,55 @@
+from csv import reader
+from json import loads
+from pathlib import Path
+from typing import Any
+import pytest
+from be import offline_import
+from be.offline_import import ImportFiles
+
+
+TAGS = {
+    'addr:street': 'Karlova',
+    'contact:phone': '+420 123',
+    'name:en': 'Cafe',
+    'id': 'collides',
+    'location': 'collides',
+}
+
+
+def _rows(dataset: str) -> list[dict[str, Any]]:
+    if dataset == 'address':
+        return [{'id': 1, 'lat': 50.0, 'lon': 14.4, 'tags': dict(TAGS)}]
+    return [{
+        'id': 2, 'lat': 50.0, 'lon': 14.4, 'name': 'Cafe',
+        'class': 'amenity', 'subclass': 'cafe', 'tags': dict(TAGS),
+    }]
+
+
+@pytest.fixture(autouse=True)
+def datasets(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(offline_import, 'iter_dataset', _rows)
+
+
+def _read(path: Path) -> tuple[list[str], list[str]]:
+    with open(path, encoding='utf-8', newline='') as f:
+        header, row = list(reader(f))
+    return header, row
+
+
+@pytest.mark.parametrize('write, name', [
+    (offline_import._write_addresses, 'addresses'),
+    (offline_import._write_poi_graph, 'poi_tags'),
+    (offline_import._write_poi_compact, 'poi'),
+])
+def test_colon_tag_keys_stay_out_of_header(
+    tmp_path: Path, write: Any, name: str
+) -> None:
+    write(tmp_path, ImportFiles())
+    header, row = _read(tmp_path.joinpath(f'{name}.csv'))
+    # no tag key becomes a column, so none is read as a type or collides
+    assert not any(column.startswith(k) for k in TAGS if ':' in k
+                   for column in header)
+    names = [column.split(':')[0] for column in header if column[0] != ':']
+    assert len(names) == len(set(names))
+    tags = [v for column, v in zip(header, row) if column.startswith('tags')]
+    assert loads(tags[0]) == TAGS